@@ -1,6 +1,8 @@
 import json
 import requests
 from flask import Blueprint, jsonify, request
+from app.utils.key_registry import key_registry, QuotaExceeded
+from app.utils.admin import require_admin
 
 # ------------------------------
 # Blueprint (REST endpoint)
@@ -64,9 +66,11 @@ def chat_completion(
     max_tokens=150,
     top_p=1.0,
     api_version="2024-12-01-preview",
+    session=None,
 ):
     """
     Sends a normal (non-streaming) chat completion request to HKBU GenAI API.
+    Pass the tenant's pooled `session` to reuse its connections.
     """
     url = f"https://genai.hkbu.edu.hk/api/v0/rest/deployments/{model_name}/chat/completions?api-version={api_version}"
 
@@ -83,7 +87,7 @@ def chat_completion(
         "stream": False,  # 👈 Ensure non-streaming mode
     }
 
-    response = requests.post(url, headers=headers, json=payload)
+    response = (session or requests).post(url, headers=headers, json=payload)
 
     if response.status_code != 200:
         return {"error": f"[ERROR {response.status_code}] {response.text}"}
@@ -98,20 +102,42 @@ def chat_completion(
 def chat():
     data = request.get_json(force=True)
     chat_history = data.get("chat_history", [])
-    api_key = data.get("api_key")
     model_name = data.get("model_name", "gpt-4")
     max_tokens = data.get("max_tokens", 150)
     top_p = data.get("top_p", 1.0)
 
+    # Upstream key comes from the server-side registry; anonymous callers
+    # don't get to spend the server's default key
+    tenant = key_registry.get(
+        request.headers.get("X-Tenant-Token"),
+        client_api_key=data.get("api_key"),
+        allow_default=False,
+    )
+    if tenant is None:
+        return jsonify({"error": "Unknown or missing tenant token"}), 403
+    try:
+        tenant.reserve()
+    except QuotaExceeded as e:
+        return jsonify({"error": str(e)}), 429
+
     # ✅ Preprocess history here
     preprocessed_history = preprocess_chat_history(chat_history)
     # Call non-streaming API
     result = chat_completion(
         chat_history=preprocessed_history,
-        api_key=api_key,
+        api_key=tenant.api_key,
         model_name=model_name,
         max_tokens=max_tokens,
         top_p=top_p,
+        session=tenant.session,
     )
+    tenant.record_tokens(result.get("usage", {}).get("total_tokens", 0))
+
+    return jsonify(result)
+
 
-    return jsonify(result)
\ No newline at end of file
+@chatbot.route("/usage", methods=["GET"])
+def usage():
+    """Per-tenant usage for today (admin only: it enumerates every tenant)."""
+    require_admin()
+    return jsonify({"tenants": key_registry.usage()})
\ No newline at end of file
@@ -0,0 +1,68 @@
+from flask import Blueprint, jsonify
+
+from app.utils.health import health_monitor, http_reachable, tcp_reachable, ffmpeg_available, HEALTH_PROBE_TIMEOUT
+from app.utils.key_registry import key_registry
+from app.utils.token_service import alicloud_tokens
+
+# ------------------------------
+# Blueprint (liveness / readiness)
+# ------------------------------
+health = Blueprint("health", __name__)
+
+
+@health.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: the process answers. Dependency state is informational only."""
+    report = health_monitor.report()
+    return jsonify(report), 200
+
+
+@health.route("/readyz", methods=["GET"])
+def readyz():
+    """Readiness: warmed up and every required dependency passed its last probe."""
+    report = health_monitor.report()
+    return jsonify(report), 200 if report["ready"] else 503
+
+
+# ------------------------------
+# Dependency probes (run in the background by health_monitor)
+# ------------------------------
+@health_monitor.probe("ffmpeg")
+def probe_ffmpeg():
+    return ffmpeg_available()
+
+
+@health_monitor.probe("asr")
+def probe_asr():
+    import speech_recognition  # noqa: F401  (the recognizer backend must be importable)
+    return http_reachable("https://www.google.com/speech-api/v2/recognize", method="GET")
+
+
+@health_monitor.probe("tts_gtts", required=False)
+def probe_gtts():
+    return http_reachable("https://translate.google.com/")
+
+
+@health_monitor.probe("tts_edge", required=False)
+def probe_edge():
+    return tcp_reachable("speech.platform.bing.com")
+
+
+@health_monitor.probe("hkbu")
+def probe_hkbu():
+    # Goes through the default tenant's pool, so it also keeps a connection warm
+    if key_registry.default is None:
+        return False, "HKBU_API_KEY not set"
+    response = key_registry.default.session.head("https://genai.hkbu.edu.hk/", timeout=HEALTH_PROBE_TIMEOUT)
+    return response.status_code < 500, f"HTTP {response.status_code}"
+
+
+@health_monitor.probe("alicloud_token", required=False)
+def probe_alicloud():
+    if not alicloud_tokens.configured:
+        return True, "not configured"
+    alicloud_tokens.get()
+    status = alicloud_tokens.status()
+    if status["has_token"]:
+        return True, f"token valid for {status['expires_in']}s"
+    return False, status["last_error"] or "no token"
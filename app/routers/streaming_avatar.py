@@ -1,19 +1,35 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request, Response, stream_with_context, send_file, send_from_directory, url_for, abort
 import io
 from flask_socketio import emit, SocketIO
-import numpy as np
-import wave
-from scipy.signal import resample
+from werkzeug.exceptions import RequestEntityTooLarge
 import speech_recognition as sr
-import requests
 import json
 import base64
 import os
+import time
+import hashlib
+import threading
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 import asyncio
 from gtts import gTTS
 import edge_tts
-import tempfile
-from pydub import AudioSegment
+from app.utils.turns import TurnCancelled
+from app.utils.sessions import session_registry
+from app.utils.speculative import SpeculativeLLM, SPECULATIVE_LLM_ENABLED, speculation_metrics, estimate_tokens, partial_due
+from app.utils.key_registry import key_registry, QuotaExceeded
+from app.utils import phrase_audio
+from app.utils.phrase_audio import PHRASES, PhrasePack
+from app.utils.async_runtime import async_runtime, ASYNC_PIPELINE_ENABLED
+from app.utils.recorder import turn_recorder, RECORDING_ENABLED
+from app.utils.tts_cache import tts_cache, is_digest
+from app.utils.health import health_monitor
+from app.utils.profiler import slow_turns
+from app.utils.admin import require_admin
+from app.utils.tts_text import SpeechChunker, prepare_speech
+from app.utils.speech import convert_audio_to_wav, convert_pcm_to_wav, recognize_speech, transcribe_clip
 
 # ------------------------------
 # Blueprint (REST endpoint)
@@ -24,219 +40,1007 @@ streaming_avatar = Blueprint("streaming_avatar", __name__)
 # Text-to-Speech Functions (Hong Kong Compatible)
 # ------------------------------
 
-def text_to_speech_gtts(text, lang='en'):
+def text_to_speech_gtts(text, lang='en', cancel_event=None):
     """
     Google Text-to-Speech (Free, works in Hong Kong)
+
+    gTTS synthesizes long text as several upstream requests; when
+    `cancel_event` is set between them, synthesis stops and None is returned.
     """
     try:
         tts = gTTS(text=text, lang=lang, slow=False)
         
-        # Use temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as tmp_file:
-            tts.save(tmp_file.name)
-            
-            # Read the audio data
-            with open(tmp_file.name, 'rb') as audio_file:
-                audio_data = audio_file.read()
-            
-            # Clean up
-            os.unlink(tmp_file.name)
+        audio_data = b""
+        for chunk in tts.stream():
+            if cancel_event is not None and cancel_event.is_set():
+                print("⏹️ GTTS synthesis cancelled")
+                return None
+            audio_data += chunk
             
         return audio_data
     except Exception as e:
         print(f"GTTS Error: {e}")
         return None
 
-async def text_to_speech_edge(text, voice='en-US-AriaNeural'):
+async def text_to_speech_edge(text, voice='en-US-AriaNeural', cancel_event=None):
     """
     Microsoft Edge TTS (Free, high quality, works in Hong Kong)
+
+    Streams audio chunks natively on the event loop; stops and returns None
+    when `cancel_event` is set.
     """
     try:
         communicate = edge_tts.Communicate(text, voice)
         
-        # Use temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as tmp_file:
-            await communicate.save(tmp_file.name)
-            
-            # Read the audio data
-            with open(tmp_file.name, 'rb') as audio_file:
-                audio_data = audio_file.read()
+        audio_data = b""
+        async for chunk in communicate.stream():
+            if cancel_event is not None and cancel_event.is_set():
+                print("⏹️ Edge TTS synthesis cancelled")
+                return None
+            if chunk["type"] == "audio":
+                audio_data += chunk["data"]
             
-            # Clean up
-            os.unlink(tmp_file.name)
-            
-        return audio_data
+        return audio_data or None
     except Exception as e:
         print(f"Edge TTS Error: {e}")
         return None
 
-def get_llm_response(user_text, api_key="f78e26ce-5d62-455a-a4f6-055df1fc1a27"):
+LLM_URL = "https://genai.hkbu.edu.hk/api/v0/rest/deployments/gpt-4.1/chat/completions?api-version=2024-12-01-preview"
+
+def build_llm_request(user_text, api_key):
+    """Headers and streamed payload shared by the sync and asyncio LLM paths."""
+    headers = {
+        "accept": "application/json",
+        "api-key": api_key,
+        "Content-Type": "application/json"
+    }
+    
+    payload = {
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are a helpful educational assistant. Keep responses concise and friendly, suitable for students."
+            },
+            {
+                "role": "user",
+                "content": user_text
+            }
+        ],
+        "max_tokens": 150,
+        "top_p": 1,
+        "stream": True  # Streamed so cancelled turns can hang up early
+    }
+    return headers, payload
+
+def parse_llm_stream_line(line):
+    """
+    Parse one server-sent event line of the HKBU stream.
+
+    :return: the content delta ("" if none), or None at end of stream
+    """
+    decoded_line = line.decode("utf-8").strip() if isinstance(line, bytes) else line.strip()
+    if not decoded_line.startswith("data: "):
+        return ""
+    data = decoded_line[len("data: "):]
+    if data == "[DONE]":
+        return None
+    event = json.loads(data)
+    if event.get("choices"):
+        return event["choices"][0].get("delta", {}).get("content") or ""
+    return ""
+
+# What get_llm_response / stream_llm_response_async say instead of a reply
+LLM_FALLBACK_REPLIES = frozenset(PHRASES[key] for key in ("llm_error", "llm_unavailable", "quota_exceeded"))
+
+def get_llm_response(user_text, tenant=None, cancel_event=None, on_delta=None, profile=None):
     """
     Get response from HKBU GenAI API (reusing existing logic)
+
+    The upstream key and pooled connection come from `tenant` (the default
+    tenant if None, refused when there is none); its quota is checked
+    before the request is sent.
+    The reply is read as a server-sent event stream so the upstream request
+    can be aborted as soon as `cancel_event` is set; None is returned then.
+    `on_delta`, if given, is called with each streamed piece of the reply;
+    upstream times are noted on the turn's `profile`, if any.
     """
+    tenant = tenant or key_registry.get()
+    if tenant is None:
+        print("🚫 No upstream key configured (HKBU_API_KEY)")
+        return PHRASES["llm_unavailable"]
     try:
-        url = "https://genai.hkbu.edu.hk/api/v0/rest/deployments/gpt-4.1/chat/completions?api-version=2024-12-01-preview"
-        
-        headers = {
-            "accept": "application/json",
-            "api-key": api_key,
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "You are a helpful educational assistant. Keep responses concise and friendly, suitable for students."
-                },
-                {
-                    "role": "user",
-                    "content": user_text
-                }
-            ],
-            "max_tokens": 150,
-            "top_p": 1,
-            "stream": False  # Non-streaming for TTS
-        }
-        
-        response = requests.post(url, headers=headers, json=payload, timeout=10)
+        tenant.reserve()
+    except QuotaExceeded as e:
+        print(f"🚫 {e}")
+        return PHRASES["quota_exceeded"]
+    
+    try:
+        headers, payload = build_llm_request(user_text, tenant.api_key)
         
-        if response.status_code == 200:
-            result = response.json()
-            return result["choices"][0]["message"]["content"]
-        else:
-            return f"Sorry, I couldn't process that. Status: {response.status_code}"
+        request_start = time.perf_counter()
+        with tenant.session.post(LLM_URL, headers=headers, json=payload, timeout=10, stream=True) as response:
+            ttfb = time.perf_counter() - request_start
+            if response.status_code != 200:
+                if profile is not None:
+                    profile.note_upstream("hkbu", ttfb, status=response.status_code)
+                print(f"LLM Error: status {response.status_code}")
+                return PHRASES["llm_error"]
+            
+            parts = []
+            for line in response.iter_lines():
+                if cancel_event is not None and cancel_event.is_set():
+                    print("⏹️ LLM request cancelled")
+                    # Billed upstream all the same
+                    tenant.record_tokens(estimate_tokens(user_text) + estimate_tokens("".join(parts)))
+                    return None
+                if not line:
+                    continue
+                delta = parse_llm_stream_line(line)
+                if delta is None:
+                    break
+                parts.append(delta)
+                if delta and on_delta is not None:
+                    on_delta(delta)
+            reply = "".join(parts)
+            if profile is not None:
+                profile.note_upstream("hkbu", time.perf_counter() - request_start,
+                                      status=response.status_code, ttfb_ms=round(ttfb * 1000, 1))
+            # The stream carries no usage block; estimate prompt + completion
+            tenant.record_tokens(estimate_tokens(user_text) + estimate_tokens(reply))
+            return reply
             
     except Exception as e:
         print(f"LLM Error: {e}")
-        return "Sorry, I'm having trouble understanding right now."
+        return PHRASES["llm_unavailable"]
+
+
+# ------------------------------
+# Asyncio Pipeline (PIPELINE_MODE=asyncio)
+# ------------------------------
+async def stream_llm_response_async(user_text, tenant=None, profile=None):
+    """
+    Async generator over the HKBU reply deltas (aiohttp, pooled session).
+    Yields a single fallback phrase instead if the upstream fails or the
+    tenant is over quota. Upstream times are noted on `profile`, if any.
+    """
+    tenant = tenant or key_registry.get()
+    if tenant is None:
+        print("🚫 No upstream key configured (HKBU_API_KEY)")
+        yield PHRASES["llm_unavailable"]
+        return
+    try:
+        tenant.reserve()
+    except QuotaExceeded as e:
+        print(f"🚫 {e}")
+        yield PHRASES["quota_exceeded"]
+        return
+    
+    produced = 0
+    try:
+        headers, payload = build_llm_request(user_text, tenant.api_key)
+        session = await async_runtime.http_session()
+        request_start = time.perf_counter()
+        async with session.post(LLM_URL, headers=headers, json=payload) as response:
+            ttfb = time.perf_counter() - request_start
+            if response.status != 200:
+                if profile is not None:
+                    profile.note_upstream("hkbu", ttfb, status=response.status)
+                print(f"LLM Error: status {response.status}")
+                yield PHRASES["llm_error"]
+                return
+            async for line in response.content:
+                delta = parse_llm_stream_line(line)
+                if delta is None:
+                    break
+                if delta:
+                    produced += estimate_tokens(delta)
+                    yield delta
+            if profile is not None:
+                profile.note_upstream("hkbu", time.perf_counter() - request_start,
+                                      status=response.status, ttfb_ms=round(ttfb * 1000, 1))
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"LLM Error: {e}")
+        yield PHRASES["llm_unavailable"]
+    finally:
+        tenant.record_tokens(estimate_tokens(user_text) + produced)
+
+async def run_reply_pipeline_async(wav_buffer, cancel_event=None, resolve_speculation=None, voice='en-US-AriaNeural', tenant=None,
+                                   profile=None):
+    """
+    ASR -> LLM -> TTS as coroutines, yielding (event, payload) pairs.
+
+    The LLM stream is cleaned up and cut into synthesis units as it arrives
+    (see tts_text.SpeechChunker); each unit is handed to Edge TTS right
+    away, so unit N is synthesized while unit N+1 is generated. Audio is
+    still yielded in order. Upstream times go to the turn's `profile`.
+    """
+    text = await asyncio.to_thread(recognize_speech, wav_buffer, profile=profile)
+    yield 'transcription', {'text': text}
+    
+    async def deltas():
+        reply = None
+        if resolve_speculation is not None:
+            reply = await asyncio.to_thread(resolve_speculation, text)
+        if reply is not None:
+            yield reply
+        else:
+            async for delta in stream_llm_response_async(text, tenant, profile):
+                yield delta
+    
+    phrase_voice = f"edge:{voice}"
+    
+    async def synthesize(sentence):
+        # -> (audio, content digest)
+        audio = phrase_pack.lookup_text(sentence, phrase_voice)
+        if audio:
+            return audio, await asyncio.to_thread(phrase_digest, sentence, audio)
+        digest = tts_cache.lookup('edge', voice, sentence)
+        audio = tts_cache.read(digest) if digest else None
+        if audio:
+            return audio, digest
+        request_start = time.perf_counter()
+        audio = await text_to_speech_edge(sentence, voice=voice, cancel_event=cancel_event)
+        if profile is not None:
+            profile.note_upstream("tts_edge", time.perf_counter() - request_start,
+                                  chars=len(sentence), audio_bytes=len(audio or b""))
+        if not audio:
+            return None, None
+        return audio, await asyncio.to_thread(tts_cache.put, 'edge', voice, sentence, audio)
+    
+    pending = []   # TTS tasks in unit order
+    chunker = SpeechChunker('edge')
+    reply, index = "", 0
+    
+    async def ready_audio(flush):
+        # Yield finished clips from the front; wait for all of them on flush
+        nonlocal index
+        while pending and (flush or pending[0].done()):
+            audio, digest = await pending.pop(0)
+            if audio:
+                # Turned into the client payload by the handler (needs the request context)
+                yield 'tts_audio', {'index': index, '_audio': audio, '_digest': digest}
+                index += 1
+    
+    try:
+        async for delta in deltas():
+            reply += delta
+            # Fallback phrases arrive whole and are pre-synthesized verbatim
+            units = [delta] if phrase_pack.lookup_text(delta, phrase_voice) else chunker.feed(delta)
+            for unit in units:
+                pending.append(asyncio.ensure_future(synthesize(unit)))
+            async for item in ready_audio(flush=False):
+                yield item
+        
+        yield 'llm_response', {'text': reply}
+        for unit in chunker.flush():
+            pending.append(asyncio.ensure_future(synthesize(unit)))
+        async for item in ready_audio(flush=True):
+            yield item
+        if index == 0:
+            yield 'error', {'message': 'Failed to generate TTS audio'}
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+# ------------------------------
+# Pre-synthesized Phrases (error prompts etc.)
+# ------------------------------
+phrase_pack = PhrasePack()
+
+def _set_phrase_pack(pack):
+    global phrase_pack
+    phrase_pack = pack
+    health_monitor.mark_ready("phrase_pack")
+
+def load_phrase_pack():
+    """Load the phrase pack; build it in the background if the deploy didn't."""
+    health_monitor.expect_warmup("phrase_pack")
+    pack = PhrasePack.load()
+    if len(pack):
+        _set_phrase_pack(pack)
+        print(f"✅ Loaded {len(phrase_pack)} pre-synthesized phrases")
+    elif os.environ.get("PHRASE_PACK_AUTOBUILD", "1") == "1":
+        print("🔄 Phrase pack missing, building it in the background...")
+        phrase_audio.build_in_background(_set_phrase_pack)
+    else:
+        _set_phrase_pack(pack)
+
+
+def phrase_digest(text, audio):
+    """
+    tts_cache digest of a pre-synthesized phrase clip, storing it on first
+    use, so phrase clips get /audio/<digest>.mp3 URLs like synthesized ones.
+    Keyed by the clip's own hash too: the same text exists in several voices.
+    """
+    clip = hashlib.sha256(audio).hexdigest()
+    return tts_cache.lookup('phrase', clip, text) or tts_cache.put('phrase', clip, text, audio)
+
+
+def pipeline_phrase_voice():
+    """Phrase pack voice matching the one replies are spoken in."""
+    return f"edge:{DEFAULT_EDGE_VOICE}" if ASYNC_PIPELINE_ENABLED else "gtts:en"
+
+
+def emit_spoken_phrase(key, turn_id=None):
+    """Speak a fixed phrase from the pack; no TTS call is made."""
+    audio = phrase_pack.lookup(key, pipeline_phrase_voice())
+    if audio:
+        payload = {'audio': base64.b64encode(audio).decode('utf-8'), 'phrase': key}
+        if turn_id is not None:
+            payload['turn_id'] = turn_id
+        emit('tts_audio', payload)
 
 
 @streaming_avatar.route("/a", methods=["GET"])
 def hello_module1():
     return jsonify({"message": "Hello from Module streaming_avatar"})
 
+@streaming_avatar.route("/sessions", methods=["GET"])
+def session_stats():
+    return jsonify(session_registry.stats())
+
+@streaming_avatar.route("/speculation", methods=["GET"])
+def speculation_stats():
+    return jsonify({"enabled": SPECULATIVE_LLM_ENABLED, **speculation_metrics.snapshot()})
+
+# ------------------------------
+# Batch Transcription (REST)
+# ------------------------------
+BATCH_MAX_CLIPS = int(os.environ.get("BATCH_MAX_CLIPS", "500"))
+BATCH_MAX_CLIP_BYTES = int(os.environ.get("BATCH_MAX_CLIP_BYTES", str(25 * 1024 * 1024)))
+# All clips of one batch together, after zip expansion (they are held in
+# memory and pickled to the workers)
+BATCH_MAX_TOTAL_BYTES = int(float(os.environ.get("BATCH_MAX_TOTAL_MB", "200")) * 1024 * 1024)
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", str(os.cpu_count() or 2)))
+
+_batch_pool = None
+_batch_pool_lock = threading.Lock()
+
+def get_batch_pool():
+    """
+    Process pool shared by batch requests (spawned: the server runs threads).
+    Workers only import app.utils.speech; main.py builds the app under
+    __main__, so re-importing it as __mp_main__ has no side effects.
+    """
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is None:
+            _batch_pool = ProcessPoolExecutor(
+                max_workers=BATCH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _batch_pool
+
+def reset_batch_pool():
+    """Drop a broken pool (e.g. a worker was OOM-killed); the next batch starts a new one."""
+    global _batch_pool
+    with _batch_pool_lock:
+        pool, _batch_pool = _batch_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+class BatchTooLarge(Exception):
+    """The clips of a batch add up to more than BATCH_MAX_TOTAL_BYTES."""
+
+
+def _read_batch_clips():
+    """
+    Collect (name, bytes) clips from the request: any number of multipart
+    files, where .zip uploads are expanded, or a raw zip request body.
+    Raises BatchTooLarge once the clips exceed BATCH_MAX_TOTAL_BYTES.
+    """
+    if request.content_length is not None and request.content_length > BATCH_MAX_TOTAL_BYTES:
+        raise BatchTooLarge()
+    archives, clips = [], []
+    for key in request.files:
+        for storage in request.files.getlist(key):
+            data = storage.read()
+            if storage.filename.lower().endswith(".zip") or zipfile.is_zipfile(io.BytesIO(data)):
+                archives.append(data)
+            else:
+                clips.append((storage.filename or key, data))
+    if not request.files and request.mimetype in ("application/zip", "application/x-zip-compressed"):
+        archives.append(request.get_data())
+
+    total = sum(len(data) for _, data in clips)
+    for data in archives:
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or os.path.basename(info.filename).startswith("."):
+                    continue
+                if info.file_size > BATCH_MAX_CLIP_BYTES:
+                    clips.append((info.filename, None))
+                    continue
+                total += info.file_size
+                if total > BATCH_MAX_TOTAL_BYTES:
+                    raise BatchTooLarge()
+                clips.append((info.filename, archive.read(info)))
+    return clips
+
+@streaming_avatar.route("/transcribe/batch", methods=["POST"])
+def transcribe_batch():
+    """
+    Transcribe many clips at once. Decode and ASR fan out over a process
+    pool; results stream back as NDJSON lines as each clip completes,
+    followed by a summary line.
+    """
+    try:
+        clips = _read_batch_clips()
+    except zipfile.BadZipFile as e:
+        return jsonify({"error": f"Invalid zip archive: {e}"}), 400
+    except (BatchTooLarge, RequestEntityTooLarge):
+        return jsonify({"error": f"Batch too large (over {BATCH_MAX_TOTAL_BYTES // (1024 * 1024)} MB of audio)"}), 413
+    if not clips:
+        return jsonify({"error": "No audio clips received"}), 400
+    if len(clips) > BATCH_MAX_CLIPS:
+        return jsonify({"error": f"Too many clips ({len(clips)} > {BATCH_MAX_CLIPS})"}), 413
+    language = request.args.get("language") or request.form.get("language") or 'en-US'
+    
+    def generate():
+        total, completed, failed = len(clips), 0, 0
+        started = time.perf_counter()
+        pool = get_batch_pool()
+        futures = {}
+        for index, (name, data) in enumerate(clips):
+            if data is None:
+                completed += 1
+                failed += 1
+                yield json.dumps({'type': 'result', 'index': index, 'clip': name, 'error': 'Clip too large',
+                                  'completed': completed, 'total': total}) + "\n"
+                continue
+            futures[pool.submit(transcribe_clip, name, data, language)] = index
+        
+        # Green wait under the monkey-patched server: other sockets and
+        # requests keep being served while the workers run
+        for future in as_completed(futures):
+            completed += 1
+            try:
+                result = future.result()
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    reset_batch_pool()
+                result = {'clip': clips[futures[future]][0], 'error': f'Worker failed: {e}'}
+            failed += 'error' in result
+            yield json.dumps({'type': 'result', 'index': futures[future], **result,
+                              'completed': completed, 'total': total}) + "\n"
+        
+        yield json.dumps({'type': 'summary', 'total': total, 'succeeded': total - failed, 'failed': failed,
+                          'seconds': round(time.perf_counter() - started, 3)}) + "\n"
+    
+    print(f"📚 Batch transcription of {len(clips)} clips")
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+# ------------------------------
+# TTS Cache and Batch Pre-rendering (REST)
+# ------------------------------
+DEFAULT_EDGE_VOICE = 'en-US-AriaNeural'
+IMMUTABLE_MAX_AGE = 31536000
+# "url": send cached TTS as a content-hash URL the browser can cache; "base64": inline audio
+TTS_AUDIO_DELIVERY = os.environ.get("TTS_AUDIO_DELIVERY", "url")
+TTS_BATCH_MAX_LINES = int(os.environ.get("TTS_BATCH_MAX_LINES", "1000"))
+# Upper bound on simultaneous upstream synthesis calls per provider
+TTS_PROVIDER_CONCURRENCY = {
+    "gtts": int(os.environ.get("TTS_GTTS_CONCURRENCY", "4")),
+    "edge": int(os.environ.get("TTS_EDGE_CONCURRENCY", "8")),
+}
+_tts_semaphores = {provider: threading.BoundedSemaphore(limit) for provider, limit in TTS_PROVIDER_CONCURRENCY.items()}
+_tts_batch_pool = ThreadPoolExecutor(max_workers=sum(TTS_PROVIDER_CONCURRENCY.values()), thread_name_prefix="tts-batch")
+
+def synthesize_speech(text, provider='gtts', voice='en', cancel_event=None, profile=None):
+    """Synthesize with one provider; `voice` is the gTTS language or the Edge voice name."""
+    request_start = time.perf_counter()
+    if provider == 'gtts':
+        audio = text_to_speech_gtts(text, lang=voice, cancel_event=cancel_event)
+    elif provider == 'edge':
+        audio = async_runtime.run(text_to_speech_edge(text, voice=voice, cancel_event=cancel_event))
+    else:
+        raise ValueError(f"Unknown TTS provider: {provider}")
+    if profile is not None:
+        profile.note_upstream(f"tts_{provider}", time.perf_counter() - request_start,
+                              chars=len(text), audio_bytes=len(audio or b""))
+    return audio
+
+def synthesize_cached(text, provider='gtts', voice='en', cancel_event=None, profile=None):
+    """
+    TTS through the disk cache (pre-rendered lesson lines are hits).
+
+    :return: (audio bytes, content digest) or (None, None) on failure
+    """
+    digest = tts_cache.lookup(provider, voice, text)
+    audio = tts_cache.read(digest) if digest else None
+    if audio:
+        return audio, digest
+    audio = synthesize_speech(text, provider, voice, cancel_event, profile)
+    if not audio:
+        return None, None
+    return audio, tts_cache.put(provider, voice, text, audio)
+
+def tts_audio_payload(audio, digest=None, **extra):
+    """`tts_audio` event payload: a cacheable URL when possible, else inline base64."""
+    if digest and TTS_AUDIO_DELIVERY == "url":
+        payload = {'url': url_for('streaming_avatar.tts_audio_file', digest=digest)}
+    else:
+        payload = {'audio': base64.b64encode(audio).decode('utf-8')}
+    payload.update(extra)
+    return payload
+
+def _prerender_line(provider, voice, text, pins):
+    digest = tts_cache.lookup(provider, voice, text, pin=pins)
+    if digest:
+        return digest, True
+    with _tts_semaphores[provider]:
+        audio = synthesize_speech(text, provider, voice)
+    if not audio:
+        raise RuntimeError("Failed to generate TTS audio")
+    return tts_cache.put(provider, voice, text, audio, pin=pins), False
+
+def _build_tts_archive(manifest):
+    """
+    Pack a batch's clips plus manifest.json into one zip, in memory.
+    Returns None if a clip has been pruned from the cache since.
+    """
+    buffer = io.BytesIO()
+    # MP3 is already compressed, so the archive only stores; fixed member
+    # dates keep the bytes (and so the ETag) the same on every request
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as archive:
+        archive.writestr(zipfile.ZipInfo("manifest.json"), manifest)
+        for digest in sorted({line['digest'] for line in json.loads(manifest) if line.get('digest')}):
+            audio = tts_cache.read(digest)
+            if audio is None:
+                return None
+            archive.writestr(zipfile.ZipInfo(f"{digest}.mp3"), audio)
+    buffer.seek(0)
+    return buffer
+
+@streaming_avatar.route("/tts/batch", methods=["POST"])
+def tts_batch():
+    """
+    Pre-render a lesson script: {"lines": [{"text", "voice"?, "lang"?, "provider"?}]}.
+
+    Identical lines are synthesized once, providers run in parallel up to
+    their concurrency limit, and everything lands in the TTS cache. Returns
+    a manifest of audio URLs and the URL of a zip with all clips.
+    """
+    data = request.get_json(force=True, silent=True) or {}
+    lines = data.get("lines")
+    if not isinstance(lines, list) or not lines:
+        return jsonify({"error": "Expected a non-empty 'lines' list"}), 400
+    if len(lines) > TTS_BATCH_MAX_LINES:
+        return jsonify({"error": f"Too many lines ({len(lines)} > {TTS_BATCH_MAX_LINES})"}), 413
+    
+    requested = []
+    for line in lines:
+        if isinstance(line, str):
+            line = {"text": line}
+        text = (line.get("text") or "").strip() if isinstance(line, dict) else ""
+        provider = (line.get("provider") or data.get("provider") or ("edge" if line.get("voice") else "gtts")) if text else None
+        if not text or provider not in TTS_PROVIDER_CONCURRENCY:
+            requested.append(None)
+            continue
+        voice = (line.get("voice") or DEFAULT_EDGE_VOICE) if provider == "edge" else (line.get("lang") or "en")
+        requested.append((provider, voice, text))
+    
+    # Pinned until the archive is written: a prune triggered by this very
+    # batch must not delete clips rendered earlier in it
+    with tts_cache.pinned() as pins:
+        unique = {item: _tts_batch_pool.submit(_prerender_line, *item, pins)
+                  for item in dict.fromkeys(filter(None, requested))}
+        
+        manifest = []
+        # .result() is a green wait under the monkey-patched server
+        for index, item in enumerate(requested):
+            if item is None:
+                manifest.append({'index': index, 'error': 'Missing text or unknown provider'})
+                continue
+            provider, voice, text = item
+            entry = {'index': index, 'text': text, 'provider': provider, 'voice': voice}
+            try:
+                digest, cached = unique[item].result()
+                entry.update(digest=digest, cached=cached,
+                             url=url_for('streaming_avatar.tts_audio_file', digest=digest))
+            except Exception as e:
+                entry['error'] = str(e)
+            manifest.append(entry)
+        synthesized = sum(1 for future in unique.values() if future.exception() is None and not future.result()[1])
+    
+        rendered = [entry for entry in manifest if entry.get('digest')]
+        archive_url = None
+        if rendered:
+            manifest_id = tts_cache.put_manifest(json.dumps(rendered, sort_keys=True).encode("utf-8"))
+            archive_url = url_for('streaming_avatar.tts_archive', archive_id=manifest_id)
+    print(f"🎬 Pre-rendered lesson script: {len(lines)} lines, {len(unique)} unique, {synthesized} synthesized")
+    
+    return jsonify({
+        'lines': manifest,
+        'unique': len(unique),
+        'synthesized': synthesized,
+        'failed': sum(1 for entry in manifest if 'error' in entry),
+        'archive_url': archive_url,
+    })
+
+@streaming_avatar.route("/audio/<digest>.mp3", methods=["GET"])
+def tts_audio_file(digest):
+    """
+    Synthesized audio by content hash. The URL can never change meaning,
+    so it is cacheable forever; conditional and range requests are honoured.
+    """
+    if not is_digest(digest):
+        abort(404)
+    response = send_from_directory(
+        os.path.abspath(tts_cache.directory), f"{digest}.mp3",
+        mimetype="audio/mpeg", etag=digest, max_age=IMMUTABLE_MAX_AGE, conditional=True,
+    )
+    response.cache_control.immutable = True
+    return response
+
+@streaming_avatar.route("/tts/archive/<archive_id>.zip", methods=["GET"])
+def tts_archive(archive_id):
+    """Zip of a pre-rendered batch, built from its manifest and the cached clips."""
+    if not archive_id.isalnum():
+        abort(404)
+    manifest = tts_cache.read_manifest(archive_id)
+    if manifest is None:
+        abort(404)
+    archive = _build_tts_archive(manifest)
+    if archive is None:
+        return jsonify({"error": "Some clips have expired from the cache; re-run the batch"}), 410
+    return send_file(archive, mimetype="application/zip", download_name=f"{archive_id}.zip",
+                     etag=archive_id, conditional=True)
+
+# ------------------------------
+# Slow-turn Profiles (admin)
+# ------------------------------
+@streaming_avatar.route("/admin/profiles", methods=["GET"])
+def list_profiles():
+    require_admin()
+    return jsonify({
+        "mode": slow_turns.mode,
+        "threshold_ms": slow_turns.threshold_ms,
+        "captured": slow_turns.captured,
+        "cprofile_skipped": slow_turns.cprofile_skipped,
+        "sample_skipped": slow_turns.sample_skipped,
+        "profiles": slow_turns.list(limit=request.args.get("limit", 50, type=int)),
+    })
+
+@streaming_avatar.route("/admin/profiles/<filename>", methods=["GET"])
+def download_profile(filename):
+    """A profile's metadata (.json), collapsed stacks (.folded) or pstats dump (.prof)."""
+    require_admin()
+    if not filename.endswith((".json", ".folded", ".prof")):
+        abort(404)
+    return send_from_directory(os.path.abspath(slow_turns.directory), filename, as_attachment=True)
+
 # ------------------------------
 # WebSocket Handlers
 # ------------------------------
 socket_namespace = "/api/streaming-avatar"
 
+# Capture parameters advertised to clients on connect. 16kHz mono is what
+# the recognizer wants, so asking the browser for it avoids uploading and
+# then resampling 48kHz stereo.
+# Transport is a CPU-for-bandwidth trade-off: "webm" (default) uploads
+# Opus at `bitrate` (24 kbit/s) and costs an ffmpeg decode per utterance;
+# "pcm" skips ffmpeg but uploads raw 16-bit samples, 256 kbit/s at 16kHz
+# mono, about ten times more. Browsers that can't capture PCM at
+# `sample_rate` fall back to webm.
+CAPTURE_SETTINGS = {
+    "sample_rate": int(os.environ.get("CAPTURE_SAMPLE_RATE", "16000")),
+    "channels": int(os.environ.get("CAPTURE_CHANNELS", "1")),
+    "bitrate": int(os.environ.get("CAPTURE_BITRATE", "24000")),
+    "chunk_ms": int(os.environ.get("CAPTURE_CHUNK_MS", "1000")),
+    "mime_type": os.environ.get("CAPTURE_MIME_TYPE", "audio/webm;codecs=opus"),
+    "transport": os.environ.get("CAPTURE_TRANSPORT", "webm"),
+}
+
+def warm_up_async_runtime():
+    """Start the event loop and its HTTP pool before the first turn needs them."""
+    health_monitor.expect_warmup("async_runtime")
+
+    def run():
+        try:
+            async_runtime.run(async_runtime.http_session(), timeout=30)
+        except Exception as e:
+            print(f"❌ Async runtime warm-up failed: {e}")
+        else:
+            health_monitor.mark_ready("async_runtime")
+
+    threading.Thread(target=run, name="async-warmup", daemon=True).start()
+
+
 def register_socketio_handlers(socketio: SocketIO):
+    load_phrase_pack()
+    if ASYNC_PIPELINE_ENABLED:
+        warm_up_async_runtime()
+
     @socketio.on("connect", namespace=socket_namespace)
-    def handle_connect():
-        print("✅ Client connected to /streaming-avatar")
+    def handle_connect(auth=None):
+        tenant_token = (auth or {}).get("tenant_token") or request.args.get("tenant_token")
+        tenant = key_registry.get(tenant_token)
+        if tenant is None:
+            print("🚫 Rejected connection: unknown or missing tenant token")
+            return False
+        session_registry.open(request.sid, tenant)
+        print(f"✅ Client connected to /streaming-avatar (tenant {tenant.name})")
         emit("message", {"info": "Connected to WebSocket!"})
+        emit("capture_settings", CAPTURE_SETTINGS)
+        emit("server_features", {"speculative_llm": SPECULATIVE_LLM_ENABLED})
 
     @socketio.on("disconnect", namespace=socket_namespace)
     def handle_disconnect():
         print("⚠️ Client disconnected from /streaming-avatar")
+        session_registry.close(request.sid)
+
+    @socketio.on("cancel_turn", namespace=socket_namespace)
+    def handle_cancel_turn(data=None):
+        """
+        Client-initiated cancellation (e.g. the student pressed stop while the
+        avatar was still thinking). Optional `turn_id` guards against
+        cancelling a newer turn than the one the client meant.
+        """
+        turn_id = data.get("turn_id") if isinstance(data, dict) else None
+        session = session_registry.get(request.sid)
+        cancelled = session_registry.cancel_turn(session, turn_id) if session is not None else None
+        if cancelled is not None:
+            print(f"⏹️ Turn {cancelled} cancelled by client")
+            emit('turn_cancelled', {'turn_id': cancelled})
+
+    @socketio.on('user_audio_chunk', namespace=socket_namespace)
+    def handle_user_audio_chunk(data):
+        """
+        Speculative mode: recording chunks streamed while the student is still
+        speaking. The accumulated audio is transcribed and, once the partial
+        transcript is stable, the LLM request is started ahead of time.
+        """
+        if not SPECULATIVE_LLM_ENABLED or not isinstance(data, dict):
+            return
+        session = session_registry.get(request.sid)
+        chunk = data.get('audio')
+        if session is None or not chunk:
+            return
+        if data.get('seq', 0) == 0:
+            session_registry.reset_partial(session)
+        if not session_registry.append_partial(session, chunk):
+            # Over the session cap or the memory budget: this utterance
+            # goes through the normal (non-speculative) path
+            return
+        buffer = session.partial
+        if session.transcribing or buffer is None:
+            # Still transcribing an earlier chunk; a later one will catch up
+            return
+        # WebM fragments can't be decoded on their own, so every attempt
+        # re-reads the whole buffer: only try again once enough new audio
+        # arrived, and not at all for long utterances
+        if not partial_due(len(buffer), session.partial_transcribed, CAPTURE_SETTINGS["bitrate"] / 8):
+            return
+        
+        session.transcribing = True
+        session.partial_transcribed = len(buffer)
+        try:
+            partial_text = recognize_speech(convert_audio_to_wav(buffer.tobytes()))
+            print(f"💭 Partial transcript: '{partial_text}'")
+            if session.partial is not buffer:
+                return  # the final user_audio already arrived
+            speculator = session.speculator
+            if speculator is None:
+                tenant = session.tenant
+                speculator = session.speculator = SpeculativeLLM(
+                    lambda text, cancel_event, on_delta: get_llm_response(
+                        text, tenant, cancel_event=cancel_event, on_delta=on_delta),
+                    failed=LLM_FALLBACK_REPLIES.__contains__,
+                )
+            speculator.observe_partial(partial_text)
+        except (sr.UnknownValueError, sr.RequestError):
+            pass
+        except Exception as e:
+            print(f"❌ Partial transcription failed: {e}")
+        finally:
+            session.transcribing = False
 
     @socketio.on('user_audio', namespace=socket_namespace)
     def handle_user_audio(data):
         """
         SOLUTION: Handle WebM to WAV conversion for speech recognition
+
+        Every utterance gets a turn id; a newer utterance from the same
+        session cancels this one (barge-in) and all events carry `turn_id`
+        so the client can drop stale replies.
         """
+        session = session_registry.get(request.sid)
+        if session is None:
+            return
+        speculator = session_registry.take_speculator(session)
+        turn = session_registry.start_turn(session)
+        turn_id = turn.turn_id
+        profile = slow_turns.begin(request.sid, turn_id)
+        tenant = session.tenant
+        # What happened in this turn, for the optional turn recorder
+        turn_log = {'timings': {}}
+        timings = turn_log['timings']
+        started = time.perf_counter()
         try:
             # Handle different data formats
+            audio_format = 'webm'
             if isinstance(data, bytes):
                 # Direct binary data
                 audio_bytes = data
                 print(f"📥 Received binary audio data, size: {len(audio_bytes)} bytes")
             elif isinstance(data, dict):
-                # JSON data with base64 encoded audio
+                # JSON data with base64 encoded audio, or binary audio plus its format
                 audio_data = data.get('audio')
                 if not audio_data:
-                    emit('error', {'message': 'No audio data received'})
+                    emit('error', {'message': 'No audio data received', 'turn_id': turn_id})
                     return
-                print(f"📥 Received JSON audio data, size: {len(audio_data)} characters (base64)")
-                audio_bytes = base64.b64decode(audio_data)
+                audio_format = data.get('format', 'webm')
+                if isinstance(audio_data, bytes):
+                    print(f"📥 Received {audio_format} audio data, size: {len(audio_data)} bytes")
+                    audio_bytes = audio_data
+                else:
+                    print(f"📥 Received JSON audio data, size: {len(audio_data)} characters (base64)")
+                    audio_bytes = base64.b64decode(audio_data)
             elif isinstance(data, str):
                 # Direct base64 string
                 print(f"📥 Received string audio data, size: {len(data)} characters (base64)")
                 audio_bytes = base64.b64decode(data)
             else:
-                emit('error', {'message': f'Unsupported data format: {type(data)}'})
+                emit('error', {'message': f'Unsupported data format: {type(data)}', 'turn_id': turn_id})
                 return
             
-            print(f"📦 Processing audio bytes, size: {len(audio_bytes)} bytes")
+            print(f"📦 Processing audio bytes, size: {len(audio_bytes)} bytes (turn {turn_id})")
+            emit('turn_started', {'turn_id': turn_id})
+            if profile is not None:
+                profile.note_input(audio_bytes=len(audio_bytes), audio_format=audio_format)
+                profile.set_stage('decode')
             
-            # CORE SOLUTION: Convert WebM to WAV using pydub + ffmpeg
             try:
-                print("🔄 Converting WebM audio to WAV format...")
-                
-                # Step 1: Load WebM audio with pydub (requires ffmpeg)
-                audio_segment = AudioSegment.from_file(
-                    io.BytesIO(audio_bytes), 
-                    format="webm"
-                )
-                print(f"✅ WebM loaded: {len(audio_segment)}ms, {audio_segment.frame_rate}Hz, {audio_segment.channels} channels")
-                
-                # Step 2: Optimize for speech recognition
-                # Convert to mono, 16kHz, 16-bit (ideal for speech recognition)
-                audio_segment = audio_segment.set_channels(1)        # Mono
-                audio_segment = audio_segment.set_frame_rate(16000)  # 16kHz
-                audio_segment = audio_segment.set_sample_width(2)    # 16-bit
-                
-                # Step 3: Export to WAV format in memory
-                wav_buffer = io.BytesIO()
-                audio_segment.export(
-                    wav_buffer, 
-                    format="wav",
-                    parameters=["-acodec", "pcm_s16le"]  # Ensure PCM encoding
-                )
-                wav_buffer.seek(0)
-                
-                print(f"✅ Converted to WAV: {len(wav_buffer.getvalue())} bytes")
-                
+                if audio_format == 'pcm_s16le':
+                    wav_buffer = convert_pcm_to_wav(audio_bytes, int(data.get('sample_rate', 16000)), int(data.get('channels', 1)))
+                else:
+                    print("🔄 Converting WebM audio to WAV format...")
+                    wav_buffer = convert_audio_to_wav(audio_bytes)
+                timings['decode'] = time.perf_counter() - started
+                if RECORDING_ENABLED:
+                    turn_log['wav'] = wav_buffer.getvalue()
+                if profile is not None:
+                    profile.note_input(wav_bytes=wav_buffer.getbuffer().nbytes)
             except Exception as conversion_error:
                 print(f"❌ Audio conversion failed: {conversion_error}")
-                emit('error', {'message': f'Audio format conversion failed: {conversion_error}'})
+                turn_log['error'] = f'conversion: {conversion_error}'
+                emit('error', {'message': f'Audio format conversion failed: {conversion_error}', 'turn_id': turn_id})
+                emit_spoken_phrase("audio_error", turn_id)
                 return
             
-            # Step 4: Speech recognition with converted audio
-            recognizer = sr.Recognizer()
-            recognizer.energy_threshold = 300
-            recognizer.dynamic_energy_threshold = True
+            turn.check()
             
+            # Step 4: Speech recognition with converted audio
             try:
-                with sr.AudioFile(wav_buffer) as source:
-                    # Adjust for ambient noise
-                    recognizer.adjust_for_ambient_noise(source, duration=0.2)
-                    # Record the audio
-                    audio_clip = recognizer.record(source)
-                    
-                print("🎯 Audio successfully processed by speech recognizer")
+                if ASYNC_PIPELINE_ENABLED:
+                    # Steps 5-7 as coroutines, TTS overlapping LLM generation
+                    resolve = speculator.resolve if speculator is not None else None
+                    stage_start = time.perf_counter()
+                    if profile is not None:
+                        profile.set_stage('asr')
+                    for event, payload in async_runtime.iterate(
+                        run_reply_pipeline_async(wav_buffer, turn.cancel_event, resolve, tenant=tenant, profile=profile),
+                        cancel_event=turn.cancel_event,
+                    ):
+                        turn.check()
+                        now = time.perf_counter()
+                        if event == 'transcription':
+                            turn_log['transcript'] = payload['text']
+                            timings['asr'], stage_start = now - stage_start, now
+                            if profile is not None:
+                                profile.set_stage('llm')
+                        elif event == 'llm_response':
+                            turn_log['reply'] = payload['text']
+                            timings['llm'], stage_start = now - stage_start, now
+                            if profile is not None:
+                                profile.set_stage('tts')
+                        elif event == 'tts_audio':
+                            audio, digest = payload.pop('_audio'), payload.pop('_digest')
+                            turn_log.setdefault('tts_audio_refs', []).append(digest)
+                            timings.setdefault('first_audio', now - started)
+                            timings['tts'] = now - stage_start if 'llm' in timings else 0.0
+                            payload = tts_audio_payload(audio, digest, **payload)
+                        payload['turn_id'] = turn_id
+                        emit(event, payload)
+                        print(f"📤 {event} sent to client (async pipeline)")
+                    turn.check()
+                    return
                 
                 # Step 5: Recognize speech
-                text = recognizer.recognize_google(audio_clip, language='en-US')
+                stage_start = time.perf_counter()
+                if profile is not None:
+                    profile.set_stage('asr')
+                text = recognize_speech(wav_buffer, profile=profile)
+                timings['asr'] = time.perf_counter() - stage_start
+                turn_log['transcript'] = text
                 
+                turn.check()
                 print(f"🗣️ User said: '{text}'")
-                emit('transcription', {'text': text})
+                emit('transcription', {'text': text, 'turn_id': turn_id})
                 
-                # Step 6: Get LLM response
-                llm_response = get_llm_response(text)
+                # Step 6: Get LLM response (reusing a speculative one if it matches)
+                stage_start = time.perf_counter()
+                if profile is not None:
+                    profile.set_stage('llm')
+                llm_response = speculator.resolve(text) if speculator is not None else None
+                speculator = None
+                if llm_response is None:
+                    llm_response = get_llm_response(text, tenant, cancel_event=turn.cancel_event, profile=profile)
+                timings['llm'] = time.perf_counter() - stage_start
+                turn_log['reply'] = llm_response
+                turn.check()
                 print(f"🤖 LLM response: '{llm_response}'")
-                emit('llm_response', {'text': llm_response})
+                emit('llm_response', {'text': llm_response, 'turn_id': turn_id})
                 
-                # Step 7: Generate TTS audio
-                tts_audio = text_to_speech_gtts(llm_response)
-                if tts_audio:
-                    tts_base64 = base64.b64encode(tts_audio).decode('utf-8')
-                    emit('tts_audio', {'audio': tts_base64})
-                    print("🔊 TTS audio sent to client")
+                # Step 7: Generate TTS audio one synthesis unit at a time, so the
+                # first clip plays while the rest is synthesized (fixed fallback
+                # replies are pre-synthesized)
+                stage_start = time.perf_counter()
+                if profile is not None:
+                    profile.set_stage('tts')
+                phrase_clip = phrase_pack.lookup_text(llm_response, "gtts:en")
+                units = [llm_response] if phrase_clip else prepare_speech(llm_response, 'gtts')
+                index = 0
+                for unit in units:
+                    if phrase_clip:
+                        tts_audio, tts_digest = phrase_clip, phrase_digest(unit, phrase_clip)
+                    else:
+                        tts_audio, tts_digest = synthesize_cached(unit, cancel_event=turn.cancel_event, profile=profile)
+                    turn.check()
+                    if not tts_audio:
+                        continue
+                    turn_log.setdefault('tts_audio_refs', []).append(tts_digest)
+                    timings.setdefault('first_audio', time.perf_counter() - started)
+                    emit('tts_audio', tts_audio_payload(tts_audio, tts_digest, index=index, turn_id=turn_id))
+                    index += 1
+                timings['tts'] = time.perf_counter() - stage_start
+                if index:
+                    print(f"🔊 {index} TTS clip(s) sent to client")
                 else:
-                    emit('error', {'message': 'Failed to generate TTS audio'})
+                    emit('error', {'message': 'Failed to generate TTS audio', 'turn_id': turn_id})
+                    emit_spoken_phrase("llm_unavailable", turn_id)
                     
             except sr.UnknownValueError:
                 print("❌ Could not understand audio")
-                emit('error', {'message': 'Could not understand audio. Please speak clearly.'})
+                turn_log['error'] = 'not_understood'
+                emit('error', {'message': PHRASES["not_understood"], 'turn_id': turn_id})
+                emit_spoken_phrase("not_understood", turn_id)
             except sr.RequestError as e:
                 print(f"❌ Speech recognition service error: {e}")
-                emit('error', {'message': f'Speech recognition error: {e}'})
+                turn_log['error'] = f'asr: {e}'
+                emit('error', {'message': f'Speech recognition error: {e}', 'turn_id': turn_id})
+                emit_spoken_phrase("llm_unavailable", turn_id)
                 
+        except TurnCancelled:
+            print(f"⏹️ Turn {turn_id} abandoned")
+            turn_log['error'] = 'cancelled'
         except Exception as e:
             print(f"❌ Error in handle_user_audio: {e}")
-            emit('error', {'message': f'Audio processing error: {e}'})
+            turn_log['error'] = str(e)
+            emit('error', {'message': f'Audio processing error: {e}', 'turn_id': turn_id})
+            emit_spoken_phrase("audio_error", turn_id)
+        finally:
+            if speculator is not None:
+                speculator.discard()
+            session_registry.finish_turn(session, turn)
+            # Clips may still be playing; this tells the client nothing more
+            # is coming, so its barge-in stops needing a cancel_turn
+            emit('turn_finished', {'turn_id': turn_id})
+            timings['total'] = time.perf_counter() - started
+            slow_turns.end(profile, timings, turn_log.get('error'))
+            if RECORDING_ENABLED and 'wav' in turn_log:
+                turn_recorder.record(
+                    request.sid, turn_id, turn_log['wav'],
+                    transcript=turn_log.get('transcript'),
+                    reply=turn_log.get('reply'),
+                    tts_audio_refs=turn_log.get('tts_audio_refs'),
+                    timings=timings,
+                    error=turn_log.get('error'),
+                )
 
     @socketio.on("test_tts", namespace=socket_namespace)
     def handle_test_tts(data):
@@ -244,15 +1048,15 @@ def register_socketio_handlers(socketio: SocketIO):
         Test TTS functionality directly
         """
         try:
-            text = data.get("text", "Hello! This is a test of the text to speech system.")
+            text = data.get("text", PHRASES["tts_test"])
             print(f"🔊 Testing TTS with text: {text}")
             
             # Generate TTS audio
-            tts_audio = text_to_speech_gtts(text)
+            tts_audio, tts_digest = phrase_pack.lookup_text(text, "gtts:en"), None
+            if not tts_audio:
+                tts_audio, tts_digest = synthesize_cached(text)
             if tts_audio:
-                # Convert to base64 for transmission
-                tts_base64 = base64.b64encode(tts_audio).decode('utf-8')
-                emit('tts_audio', {'audio': tts_base64})
+                emit('tts_audio', tts_audio_payload(tts_audio, tts_digest))
                 emit('message', {'info': f'TTS generated for: {text}'})
             else:
                 emit('error', {'message': 'Failed to generate TTS audio'})
@@ -0,0 +1,15 @@
+# admin.py
+# -*- coding: utf-8 -*-
+import hmac
+import os
+
+from flask import abort, request
+
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+
+def require_admin():
+    """Admin routes are closed unless ADMIN_TOKEN is set and sent as X-Admin-Token."""
+    sent = request.headers.get("X-Admin-Token") or ""
+    if not ADMIN_TOKEN or not hmac.compare_digest(sent.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        abort(403)
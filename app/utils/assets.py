@@ -0,0 +1,95 @@
+# assets.py
+# -*- coding: utf-8 -*-
+"""
+Static asset serving with strong ETags, precompressed variants and
+conditional / range request support.
+
+All files under static/ are read once at startup; text assets get gzip
+and brotli variants. Everything is served with `no-cache` so browsers
+revalidate with the ETag and get a cheap 304 (the pages are only HTML,
+loaded by URLs that can't carry a content fingerprint).
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from flask import Response, abort, request
+
+try:
+    import brotli
+except ImportError:  # in requirements.txt; gzip alone still works without it
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {".html", ".htm", ".js", ".mjs", ".css", ".json", ".svg", ".txt", ".xml", ".map"}
+# Variants smaller than this aren't worth the Content-Encoding overhead
+MIN_COMPRESS_BYTES = 512
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+class Asset:
+    __slots__ = ("data", "etag", "mimetype", "variants")
+
+    def __init__(self, data, mimetype):
+        self.data = data
+        self.etag = hashlib.sha256(data).hexdigest()[:32]
+        self.mimetype = mimetype
+        # encoding -> compressed bytes, only kept when actually smaller
+        self.variants = {}
+
+
+class StaticAssets:
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        self._assets = {}
+
+    def build(self):
+        """Load every file and build its compressed variants."""
+        assets = {}
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    data = f.read()
+                mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                asset = Asset(data, mimetype)
+                if os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS and len(data) >= MIN_COMPRESS_BYTES:
+                    compressed = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+                    if brotli is not None:
+                        compressed["br"] = brotli.compress(data, quality=11)
+                    asset.variants = {enc: body for enc, body in compressed.items() if len(body) < len(data)}
+                assets[relative] = asset
+        self._assets = assets
+        print(f"✅ Static assets ready: {len(assets)} files")
+        return self
+
+    def get(self, filename):
+        return self._assets.get(filename)
+
+    def serve(self, filename):
+        asset = self.get(filename)
+        if asset is None:
+            abort(404)
+
+        encoding = _negotiate_encoding(asset)
+        body = asset.variants[encoding] if encoding else asset.data
+        response = Response(body, mimetype=asset.mimetype)
+        # Each representation needs its own strong validator
+        response.set_etag(f"{asset.etag}-{encoding}" if encoding else asset.etag)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        if asset.variants:
+            response.vary.add("Accept-Encoding")
+        response.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+        return response.make_conditional(request, accept_ranges=True, complete_length=len(body))
+
+
+def _negotiate_encoding(asset):
+    if not asset.variants:
+        return None
+    accepted = request.accept_encodings
+    for encoding in ("br", "gzip"):
+        if encoding in asset.variants and accepted[encoding]:
+            return encoding
+    return None
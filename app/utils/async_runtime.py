@@ -0,0 +1,108 @@
+# async_runtime.py
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+import queue
+import threading
+
+import aiohttp
+
+# "sync" keeps the original requests/gTTS pipeline; "asyncio" runs the
+# LLM stream, Edge TTS and ASR as coroutines on a dedicated loop thread.
+PIPELINE_MODE = os.environ.get("PIPELINE_MODE", "sync")
+ASYNC_PIPELINE_ENABLED = PIPELINE_MODE == "asyncio"
+
+_ITEM, _ERROR, _DONE = range(3)
+
+
+class AsyncRuntime:
+    """
+    One asyncio event loop in a background thread, shared by all sessions.
+
+    Socket handlers stay synchronous: they submit coroutines (or iterate
+    async generators) while hundreds of idle upstream waits share the loop.
+    This relies on main.py calling eventlet.monkey_patch() first: the loop
+    thread and the hand-off queue are then green, so a handler waiting for
+    the next item parks only its own greenlet and the hub keeps serving
+    other sockets. Unpatched, every wait would stall the whole server.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._session = None
+
+    @property
+    def loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="async-runtime", daemon=True)
+                thread.start()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, coro):
+        """Schedule `coro` on the loop; returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        return self.submit(coro).result(timeout)
+
+    def iterate(self, agen, cancel_event=None):
+        """
+        Drive an async generator from synchronous code, yielding its items
+        as they are produced. Closing the iterator, or setting the optional
+        threading.Event `cancel_event`, cancels the generator mid-await.
+        """
+        items = queue.Queue()
+
+        async def pump():
+            watcher = None
+            if cancel_event is not None:
+                watcher = asyncio.ensure_future(_cancel_when_set(cancel_event, asyncio.current_task()))
+            try:
+                async for item in agen:
+                    items.put((_ITEM, item))
+            except asyncio.CancelledError:
+                items.put((_DONE, None))
+                raise
+            except Exception as e:
+                items.put((_ERROR, e))
+            else:
+                items.put((_DONE, None))
+            finally:
+                if watcher is not None:
+                    watcher.cancel()
+
+        future = self.submit(pump())
+        try:
+            while True:
+                kind, value = items.get()
+                if kind == _ITEM:
+                    yield value
+                elif kind == _ERROR:
+                    raise value
+                else:
+                    return
+        finally:
+            if not future.done():
+                future.cancel()
+
+    async def http_session(self):
+        """Pooled aiohttp session; must be awaited on the runtime loop."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=int(os.environ.get("ASYNC_HTTP_POOL_SIZE", "100"))),
+                timeout=aiohttp.ClientTimeout(total=30, sock_connect=10),
+            )
+        return self._session
+
+
+async_runtime = AsyncRuntime()
+
+
+async def _cancel_when_set(cancel_event, task, interval=0.05):
+    while not cancel_event.is_set():
+        await asyncio.sleep(interval)
+    task.cancel()
@@ -0,0 +1,122 @@
+# health.py
+# -*- coding: utf-8 -*-
+"""
+Background dependency probes and warm-up tracking for /healthz and /readyz.
+
+Probes run on their own thread every HEALTH_PROBE_INTERVAL seconds and
+only their cached results are served, so a slow upstream can never make a
+health check slow. Readiness additionally waits for the components that
+registered a warm-up step (the phrase pack, and the async runtime in
+asyncio pipeline mode).
+"""
+import os
+import shutil
+import socket
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+HEALTH_PROBE_INTERVAL = float(os.environ.get("HEALTH_PROBE_INTERVAL", "30"))
+HEALTH_PROBE_TIMEOUT = float(os.environ.get("HEALTH_PROBE_TIMEOUT", "5"))
+
+
+class HealthMonitor:
+    def __init__(self, interval=HEALTH_PROBE_INTERVAL):
+        self.interval = interval
+        self._probes = {}       # name -> (callable, required for readiness)
+        self._results = {}
+        self._warmup = {}       # component -> done?
+        self._lock = threading.Lock()
+        self._thread = None
+        self._started_at = time.time()
+
+    def probe(self, name, required=True):
+        """Decorator registering `fn() -> (ok, detail)` as a dependency probe."""
+        def register(fn):
+            self._probes[name] = (fn, required)
+            return fn
+        return register
+
+    def expect_warmup(self, component):
+        with self._lock:
+            self._warmup.setdefault(component, False)
+
+    def mark_ready(self, component):
+        with self._lock:
+            self._warmup[component] = True
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name="health-probes", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        with ThreadPoolExecutor(max_workers=max(1, len(self._probes)), thread_name_prefix="health") as pool:
+            while True:
+                list(pool.map(self._run_probe, list(self._probes)))
+                time.sleep(self.interval)
+
+    def _run_probe(self, name):
+        fn, required = self._probes[name]
+        started = time.perf_counter()
+        try:
+            ok, detail = fn()
+        except Exception as e:
+            ok, detail = False, str(e)
+        result = {
+            "ok": bool(ok),
+            "required": required,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            "detail": detail,
+            "checked_at": time.time(),
+        }
+        with self._lock:
+            self._results[name] = result
+
+    def report(self):
+        with self._lock:
+            results = {name: dict(result) for name, result in self._results.items()}
+            warmup = dict(self._warmup)
+        now = time.time()
+        for result in results.values():
+            result["age_s"] = round(now - result.pop("checked_at"), 1)
+        pending_probes = sorted(set(self._probes) - set(results))
+        failing = sorted(name for name, result in results.items() if result["required"] and not result["ok"])
+        warming = sorted(component for component, done in warmup.items() if not done)
+        return {
+            "status": "ok" if not failing and not pending_probes else "degraded",
+            "ready": not failing and not pending_probes and not warming,
+            "uptime_s": round(now - self._started_at, 1),
+            "dependencies": results,
+            "failing": failing,
+            "pending_probes": pending_probes,
+            "warming_up": warming,
+        }
+
+
+def http_reachable(url, method="HEAD"):
+    """Any HTTP answer below 500 means the service is up."""
+    response = requests.request(method, url, timeout=HEALTH_PROBE_TIMEOUT, allow_redirects=False)
+    return response.status_code < 500, f"HTTP {response.status_code}"
+
+
+def tcp_reachable(host, port=443):
+    with socket.create_connection((host, port), timeout=HEALTH_PROBE_TIMEOUT):
+        return True, f"{host}:{port} reachable"
+
+
+def ffmpeg_available():
+    binary = shutil.which("ffmpeg")
+    if not binary:
+        return False, "ffmpeg not found on PATH"
+    result = subprocess.run([binary, "-version"], capture_output=True, timeout=HEALTH_PROBE_TIMEOUT)
+    first_line = result.stdout.decode("utf-8", "replace").splitlines()[:1]
+    return result.returncode == 0, first_line[0] if first_line else f"exit {result.returncode}"
+
+
+health_monitor = HealthMonitor()
@@ -0,0 +1,288 @@
+# key_registry.py
+# -*- coding: utf-8 -*-
+"""
+Server-side registry of upstream (HKBU GenAI) API keys per tenant.
+
+Tenants (schools / classes) are configured in a JSON file pointed to by
+TENANT_KEYS_FILE, or inline in TENANT_KEYS:
+
+    {
+      "school-a": {"api_key": "...", "client_token": "...", "daily_requests": 5000, "daily_tokens": 500000},
+      "school-b": {"api_key": "...", "client_token": "...", "pool_size": 20}
+    }
+
+Clients select their tenant with its secret `client_token` (never by name),
+so a school can't spend another school's quota. Each tenant gets its own
+pooled requests.Session, so one school's slow calls can't use up another
+school's connections, plus daily request/token quotas that are checked
+before any upstream call.
+
+The "default" tenant uses HKBU_API_KEY, with the DEFAULT_DAILY_REQUESTS /
+DEFAULT_DAILY_TOKENS quotas. It serves calls without a token only while no
+tenants are configured; without HKBU_API_KEY there is no default tenant and
+such calls are refused.
+
+With ALLOW_CLIENT_API_KEYS=1, a key sent by a client (the old behaviour)
+gets an ad-hoc tenant. Ad-hoc tenants are looked up only by the key
+itself, never by name, and at most ADHOC_TENANT_LIMIT of them are kept;
+they are dropped after ADHOC_TENANT_IDLE_SECONDS without a request.
+"""
+import collections
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_TENANT = "default"
+# Empty means no limit
+DEFAULT_DAILY_REQUESTS = os.environ.get("DEFAULT_DAILY_REQUESTS", "2000")
+DEFAULT_DAILY_TOKENS = os.environ.get("DEFAULT_DAILY_TOKENS", "500000")
+
+# Keys sent by clients in request bodies (the old behaviour) become ad-hoc tenants
+ALLOW_CLIENT_API_KEYS = os.environ.get("ALLOW_CLIENT_API_KEYS", "0") == "1"
+ADHOC_TENANT_LIMIT = int(os.environ.get("ADHOC_TENANT_LIMIT", "100"))
+ADHOC_TENANT_IDLE_SECONDS = float(os.environ.get("ADHOC_TENANT_IDLE_SECONDS", "3600"))
+USAGE_FLUSH_SECONDS = float(os.environ.get("USAGE_FLUSH_SECONDS", "5"))
+USAGE_LOG_PATH = os.environ.get("USAGE_LOG_PATH")
+
+
+class QuotaExceeded(Exception):
+    """The tenant has used up its daily requests or tokens."""
+
+
+def _today():
+    return time.strftime("%Y-%m-%d", time.gmtime())
+
+
+def _token_hash(token):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class Tenant:
+    """
+    One upstream key with its own connection pool and usage counters.
+
+    The hot path never takes a lock: request slots come from an
+    itertools.count and token usage is appended to a deque; the registry's
+    flusher thread folds the deque into the daily totals.
+    """
+
+    def __init__(self, name, api_key, daily_requests=None, daily_tokens=None, pool_size=10):
+        self.name = name
+        self.api_key = api_key
+        self.daily_requests = daily_requests
+        self.daily_tokens = daily_tokens
+        self.pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+        self.day = _today()
+        self._request_slots = itertools.count()
+        self._pending = collections.deque()
+        self.requests_today = 0
+        self.tokens_today = 0
+        self.rejected_today = 0
+        self.last_used = time.monotonic()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+        return self._session
+
+    def close(self):
+        """Release the pooled connections (the tenant stays usable)."""
+        with self._session_lock:
+            session, self._session = self._session, None
+        if session is not None:
+            session.close()
+
+    def reserve(self):
+        """
+        Claim a request slot before contacting upstream.
+        Raises QuotaExceeded when the daily request or token budget is spent.
+        """
+        if self.daily_tokens is not None and self.tokens_today >= self.daily_tokens:
+            self._pending.append((0, 0, 1))
+            raise QuotaExceeded(f"Tenant '{self.name}' used its {self.daily_tokens} tokens for today")
+        slot = next(self._request_slots)
+        if self.daily_requests is not None and slot >= self.daily_requests:
+            self._pending.append((0, 0, 1))
+            raise QuotaExceeded(f"Tenant '{self.name}' used its {self.daily_requests} requests for today")
+        self._pending.append((1, 0, 0))
+
+    def record_tokens(self, tokens):
+        if tokens:
+            self._pending.append((0, tokens, 0))
+
+    def flush(self):
+        """Fold pending usage into the daily totals (flusher thread only)."""
+        requests_, tokens, rejected = 0, 0, 0
+        while True:
+            try:
+                r, t, x = self._pending.popleft()
+            except IndexError:
+                break
+            requests_ += r
+            tokens += t
+            rejected += x
+        self.requests_today += requests_
+        self.tokens_today += tokens
+        self.rejected_today += rejected
+        today = _today()
+        if today != self.day:
+            self.day = today
+            self._request_slots = itertools.count()
+            self.requests_today = self.tokens_today = self.rejected_today = 0
+        return requests_, tokens, rejected
+
+    def usage(self):
+        return {
+            "tenant": self.name,
+            "day": self.day,
+            "requests": self.requests_today,
+            "tokens": self.tokens_today,
+            "rejected": self.rejected_today,
+            "daily_requests": self.daily_requests,
+            "daily_tokens": self.daily_tokens,
+        }
+
+
+class KeyRegistry:
+    def __init__(self, config=None, default_api_key=None, adhoc_limit=ADHOC_TENANT_LIMIT,
+                 adhoc_idle_seconds=ADHOC_TENANT_IDLE_SECONDS):
+        self._tenants = {}
+        self._by_token = {}     # sha256 of client_token -> configured Tenant
+        # Ad-hoc tenants by sha256 of their key, least recently used first;
+        # deliberately not reachable through a tenant name
+        self._adhoc = collections.OrderedDict()
+        self._retired = collections.deque()     # dropped ad-hoc tenants with usage left to flush
+        self.adhoc_limit = adhoc_limit
+        self.adhoc_idle_seconds = adhoc_idle_seconds
+        self._lock = threading.Lock()
+        self._flusher = None
+        self.default = None
+        if default_api_key:
+            self.default = self._tenants[DEFAULT_TENANT] = Tenant(
+                DEFAULT_TENANT,
+                default_api_key,
+                daily_requests=int(DEFAULT_DAILY_REQUESTS) if DEFAULT_DAILY_REQUESTS else None,
+                daily_tokens=int(DEFAULT_DAILY_TOKENS) if DEFAULT_DAILY_TOKENS else None,
+            )
+        for name, settings in (config or {}).items():
+            if name == DEFAULT_TENANT:
+                raise ValueError(f"Tenant name '{DEFAULT_TENANT}' is reserved")
+            token_hash = _token_hash(settings["client_token"])
+            if token_hash in self._by_token:
+                raise ValueError(f"Tenant '{name}' reuses another tenant's client_token")
+            self._tenants[name] = self._by_token[token_hash] = Tenant(
+                name,
+                settings["api_key"],
+                daily_requests=settings.get("daily_requests"),
+                daily_tokens=settings.get("daily_tokens"),
+                pool_size=settings.get("pool_size", 10),
+            )
+
+    @classmethod
+    def from_env(cls):
+        default_api_key = os.environ.get("HKBU_API_KEY")
+        path = os.environ.get("TENANT_KEYS_FILE")
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                return cls(json.load(f), default_api_key)
+        inline = os.environ.get("TENANT_KEYS")
+        return cls(json.loads(inline) if inline else None, default_api_key)
+
+    def get(self, client_token=None, client_api_key=None, allow_default=True):
+        """
+        Resolve the tenant for a request: a configured tenant by its client
+        token, else an ad-hoc tenant for a client-supplied key (if allowed),
+        else the default tenant when `allow_default` and no tenants are
+        configured. Returns None when the request can't be served.
+        """
+        self._ensure_flusher()
+        if client_token:
+            return self._by_token.get(_token_hash(client_token))
+        if client_api_key and ALLOW_CLIENT_API_KEYS:
+            return self._adhoc_tenant(client_api_key)
+        if allow_default and not self._by_token:
+            return self.default
+        return None
+
+    def _adhoc_tenant(self, client_api_key):
+        key_hash = _token_hash(client_api_key)
+        with self._lock:
+            tenant = self._adhoc.get(key_hash)
+            if tenant is None:
+                tenant = self._adhoc[key_hash] = Tenant("key-" + key_hash[:12], client_api_key)
+                while len(self._adhoc) > self.adhoc_limit:
+                    self._retired.append(self._adhoc.popitem(last=False)[1])
+            else:
+                self._adhoc.move_to_end(key_hash)
+            tenant.last_used = time.monotonic()
+        return tenant
+
+    def expire_adhoc(self):
+        """Drop ad-hoc tenants idle for longer than adhoc_idle_seconds."""
+        cutoff = time.monotonic() - self.adhoc_idle_seconds
+        with self._lock:
+            while self._adhoc:
+                key_hash, tenant = next(iter(self._adhoc.items()))
+                if tenant.last_used >= cutoff:
+                    break
+                del self._adhoc[key_hash]
+                self._retired.append(tenant)
+
+    def usage(self):
+        with self._lock:
+            adhoc = list(self._adhoc.values())
+        return [tenant.usage() for tenant in list(self._tenants.values()) + adhoc]
+
+    def flush(self):
+        self.expire_adhoc()
+        retired = []
+        while self._retired:
+            retired.append(self._retired.popleft())
+        with self._lock:
+            adhoc = list(self._adhoc.values())
+        lines = []
+        for tenant in list(self._tenants.values()) + adhoc + retired:
+            requests_, tokens, rejected = tenant.flush()
+            if requests_ or tokens or rejected:
+                lines.append({"ts": time.time(), "tenant": tenant.name, "requests": requests_,
+                              "tokens": tokens, "rejected": rejected})
+        for tenant in retired:
+            tenant.close()
+        if lines and USAGE_LOG_PATH:
+            with open(USAGE_LOG_PATH, "a", encoding="utf-8") as log:
+                for line in lines:
+                    log.write(json.dumps(line) + "\n")
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="usage-flusher", daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(USAGE_FLUSH_SECONDS)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ Usage flush failed: {e}")
+
+
+key_registry = KeyRegistry.from_env()
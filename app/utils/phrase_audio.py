@@ -0,0 +1,166 @@
+# phrase_audio.py
+# -*- coding: utf-8 -*-
+"""
+Pre-synthesized audio for the fixed phrases the avatar says on error paths.
+
+The pack is built once (at deploy time or in the background on first
+startup) so failures never need a TTS round trip:
+
+    python -m app.utils.phrase_audio build
+
+File layout: MAGIC | uint32 index length | JSON index | audio blobs.
+The index maps "<voice>/<phrase key>" to [offset, length] into the blobs.
+
+Phrases are looked up in the voice the conversation is using, so a
+fallback doesn't switch voice mid-conversation; a voice missing from the
+pack falls back to DEFAULT_VOICE.
+"""
+import asyncio
+import json
+import os
+import struct
+import sys
+import threading
+
+MAGIC = b"ATPH\x01"
+
+PHRASE_PACK_PATH = os.environ.get(
+    "PHRASE_PACK_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "..", "assets", "phrases.pack"),
+)
+# Voices are "<provider>:<lang or voice name>", e.g. "gtts:en" or "edge:en-US-AriaNeural";
+# by default the voice of the configured pipeline mode plus gtts:en
+_DEFAULT_VOICES = "gtts:en,edge:en-US-AriaNeural" if os.environ.get("PIPELINE_MODE") == "asyncio" else "gtts:en"
+PHRASE_VOICES = [v for v in os.environ.get("PHRASE_PACK_VOICES", _DEFAULT_VOICES).split(",") if v]
+DEFAULT_VOICE = PHRASE_VOICES[0] if PHRASE_VOICES else "gtts:en"
+
+# Fixed utterances; the text is what the client sees, the audio what it hears
+PHRASES = {
+    "llm_unavailable": "Sorry, I'm having trouble understanding right now.",
+    "llm_error": "Sorry, I couldn't process that.",
+    "quota_exceeded": "Sorry, your class has used up today's AI allowance. Please try again tomorrow.",
+    "not_understood": "Could not understand audio. Please speak clearly.",
+    "audio_error": "Sorry, I couldn't hear that properly. Please try again.",
+    "tts_test": "Hello! This is a test of the text to speech system.",
+    "tts_test_avatar": "Hello! This is a test of the text-to-speech system. I am your educational avatar assistant.",
+}
+
+
+class PhrasePack:
+    """Read-only view over a packed phrase audio file."""
+
+    def __init__(self, index=None, blob=b""):
+        self._index = index or {}
+        self._blob = blob
+        self._by_text = {text: key for key, text in PHRASES.items()}
+
+    @classmethod
+    def load(cls, path=PHRASE_PACK_PATH):
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data.startswith(MAGIC):
+            print(f"❌ Ignoring phrase pack with unknown format: {path}")
+            return cls()
+        header = len(MAGIC) + 4
+        (index_len,) = struct.unpack(">I", data[len(MAGIC):header])
+        index = json.loads(data[header:header + index_len].decode("utf-8"))
+        return cls(index, data[header + index_len:])
+
+    def __len__(self):
+        return len(self._index)
+
+    def lookup(self, key, voice=None):
+        """Audio of phrase `key` in `voice`, else in DEFAULT_VOICE."""
+        entry = self._index.get(f"{voice}/{key}") if voice else None
+        if entry is None:
+            entry = self._index.get(f"{DEFAULT_VOICE}/{key}")
+        if entry is None:
+            return None
+        offset, length = entry
+        return self._blob[offset:offset + length]
+
+    def lookup_text(self, text, voice=None):
+        """Audio for `text` if it is exactly one of the fixed phrases."""
+        key = self._by_text.get((text or "").strip())
+        return self.lookup(key, voice) if key else None
+
+
+def write_phrase_pack(entries, path=PHRASE_PACK_PATH):
+    """
+    Write {"<voice>/<key>": audio_bytes} as a phrase pack.
+    The file is replaced atomically so running servers never read half a pack.
+    """
+    index, blobs, offset = {}, [], 0
+    for name in sorted(entries):
+        audio = entries[name]
+        index[name] = [offset, len(audio)]
+        blobs.append(audio)
+        offset += len(audio)
+    index_bytes = json.dumps(index, separators=(",", ":")).encode("utf-8")
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack(">I", len(index_bytes)))
+        f.write(index_bytes)
+        for audio in blobs:
+            f.write(audio)
+    os.replace(tmp_path, path)
+
+
+def synthesize_phrase(text, voice):
+    # Imported lazily: the router imports this module at startup
+    from app.routers.streaming_avatar import text_to_speech_gtts, text_to_speech_edge
+
+    provider, _, name = voice.partition(":")
+    if provider == "gtts":
+        return text_to_speech_gtts(text, lang=name or "en")
+    if provider == "edge":
+        return asyncio.run(text_to_speech_edge(text, voice=name))
+    raise ValueError(f"Unknown TTS provider in voice '{voice}'")
+
+
+def build_phrase_pack(path=PHRASE_PACK_PATH, voices=None):
+    """Synthesize every phrase for every voice and write the pack."""
+    entries = {}
+    for voice in voices or PHRASE_VOICES:
+        for key, text in PHRASES.items():
+            audio = synthesize_phrase(text, voice)
+            if not audio:
+                print(f"❌ Could not synthesize phrase '{key}' for {voice}")
+                continue
+            entries[f"{voice}/{key}"] = audio
+    if not entries:
+        print("❌ Phrase pack not written: no phrase could be synthesized")
+        return 0
+    write_phrase_pack(entries, path)
+    print(f"✅ Phrase pack written: {len(entries)} clips -> {path}")
+    return len(entries)
+
+
+def build_in_background(on_done):
+    """
+    Build a missing pack without delaying startup; `on_done(pack)` gets the
+    result (an empty pack if the build failed).
+    """
+    def run():
+        try:
+            build_phrase_pack()
+        except Exception as e:
+            print(f"❌ Phrase pack build failed: {e}")
+        on_done(PhrasePack.load())
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "build":
+        print("Usage: python -m app.utils.phrase_audio build")
+        sys.exit(2)
+    # Never fail the deploy over this: the server rebuilds a missing pack itself
+    build_phrase_pack()
@@ -0,0 +1,309 @@
+# profiler.py
+# -*- coding: utf-8 -*-
+"""
+Slow-turn capture: profile avatar turns (opt-in), keep the evidence
+only for turns slower than SLOW_TURN_MS.
+
+PROFILE_MODE selects how a turn is profiled:
+
+    sample    a background OS thread samples the handler's stack every
+              PROFILE_SAMPLE_MS; stored as collapsed stacks ("frame;frame;
+              frame count" lines, readable by flamegraph.pl and
+              speedscope). The sampler holds the GIL while it walks the
+              stacks, so at most PROFILE_MAX_SAMPLED_TURNS turns are
+              sampled at once (later ones keep their timings only) and
+              frames are kept raw, formatted only when a slow turn is saved.
+    cprofile  deterministic cProfile of the handler, one pstats dump per
+              stage (`python -m pstats <file>`). cProfile hooks the OS
+              thread, and under eventlet every handler shares it: only one
+              turn at a time is profiled (turns starting meanwhile keep
+              their timings but get no dump), and the dump also contains
+              whatever other greenlets ran during that turn. Meant for
+              reproducing a slow turn with one client, not for production.
+    off       (default) no profiling
+
+Upstream response times are attributed by passing the turn's TurnProfile
+to the calls that make them (they may run on other threads or on the
+asyncio runtime, so nothing is looked up implicitly).
+
+Each kept turn is a `<id>.json` metadata file (turn id, session, input
+audio size, stage timings, upstream response times) plus its profile
+file in PROFILES_DIR. Only the newest PROFILES_KEEP turns are kept.
+"""
+import collections
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import greenlet
+except ImportError:  # optional; only needed to attribute frames under eventlet
+    greenlet = None
+
+PROFILE_MODE = os.environ.get("PROFILE_MODE", "off")
+SLOW_TURN_MS = float(os.environ.get("SLOW_TURN_MS", "8000"))
+PROFILE_SAMPLE_MS = float(os.environ.get("PROFILE_SAMPLE_MS", "10"))
+PROFILE_MAX_SAMPLED_TURNS = int(os.environ.get("PROFILE_MAX_SAMPLED_TURNS", "8"))
+PROFILES_DIR = os.environ.get("PROFILES_DIR", "profiles")
+PROFILES_KEEP = int(os.environ.get("PROFILES_KEEP", "200"))
+
+# Deep recursion isn't interesting here; cap stacks to keep files small
+_MAX_STACK_DEPTH = 64
+
+
+def _original(module, patched_name):
+    """`module` as it was before eventlet.monkey_patch(), if it was patched."""
+    eventlet = sys.modules.get("eventlet")
+    if eventlet is not None and eventlet.patcher.is_monkey_patched(patched_name):
+        return eventlet.patcher.original(module.__name__)
+    return module
+
+
+def _raw_stack(frame):
+    """The stack as (code, lineno) pairs, innermost first; cheap enough for the sampler."""
+    stack = []
+    while frame is not None and len(stack) < _MAX_STACK_DEPTH:
+        stack.append((frame.f_code, frame.f_lineno))
+        frame = frame.f_back
+    return tuple(stack)
+
+
+def _collapse(stage, stack):
+    labels = [f"{code.co_name} ({os.path.basename(code.co_filename)}:{lineno})" for code, lineno in reversed(stack)]
+    return ";".join([f"[{stage}]"] + labels)
+
+
+class _StackSampler:
+    """
+    One sampling thread shared by every active turn. It is a real OS
+    thread even when eventlet has patched threading; a green one could only
+    run between switches and would never see a handler busy on the CPU.
+    """
+
+    def __init__(self, interval, max_targets):
+        self.interval = interval
+        self.max_targets = max_targets
+        self._targets = {}      # TurnProfile -> (OS thread ident, greenlet or None)
+        self._threading = None
+        self._lock = None
+        self._thread = None
+
+    def _setup(self):
+        # Resolved on first use: eventlet patches before the first turn
+        if self._threading is None:
+            self._threading = _original(threading, "thread")
+            self._sleep = _original(time, "time").sleep
+            self._lock = self._threading.Lock()
+
+    def add(self, profile):
+        """Start sampling `profile`'s turn; False when max_targets turns already are."""
+        self._setup()
+        target = (self._threading.get_ident(), greenlet.getcurrent() if greenlet is not None else None)
+        with self._lock:
+            if len(self._targets) >= self.max_targets:
+                return False
+            self._targets[profile] = target
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = self._threading.Thread(target=self._loop, name="turn-sampler", daemon=True)
+                self._thread.start()
+        return True
+
+    def remove(self, profile):
+        if self._lock is None:
+            return
+        with self._lock:
+            self._targets.pop(profile, None)
+
+    def _loop(self):
+        while True:
+            self._sleep(self.interval)
+            # Held for the whole pass so remove() guarantees no further writes
+            with self._lock:
+                if not self._targets:
+                    continue
+                frames = sys._current_frames()
+                for profile, (ident, glet) in self._targets.items():
+                    # A suspended greenlet (waiting on I/O) keeps its own frame;
+                    # a running one is whatever its OS thread is executing
+                    frame = glet.gr_frame if glet is not None else None
+                    if frame is None:
+                        frame = frames.get(ident)
+                    if frame is not None:
+                        profile.samples[(profile.stage, _raw_stack(frame))] += 1
+
+
+class TurnProfile:
+    """Profiling state of one in-flight turn."""
+
+    def __init__(self, monitor, session_id, turn_id, cprofile=False, sampled=False):
+        self.monitor = monitor
+        self.session_id = session_id
+        self.turn_id = turn_id
+        self.cprofile = cprofile    # owns the thread's cProfile hook
+        self.sampled = sampled      # has a slot in the stack sampler
+        self.stage = "start"
+        self.samples = collections.Counter()    # (stage, raw stack) -> count
+        self.stage_profiles = {}
+        self.upstream = []
+        self.inputs = {}
+        self.started = time.perf_counter()
+        self._profiler = None
+
+    def set_stage(self, stage):
+        """Label what the turn is doing now (decode, asr, llm, tts...)."""
+        if self.cprofile:
+            self._stop_cprofile()
+            profiler = self.stage_profiles.setdefault(stage, cProfile.Profile())
+            try:
+                profiler.enable()
+                self._profiler = profiler
+            except ValueError:
+                pass  # some other cProfile user holds the thread's hook
+        self.stage = stage
+
+    def note_input(self, **values):
+        self.inputs.update(values)
+
+    def note_upstream(self, name, seconds, **extra):
+        """Record an upstream call's latency (safe from any thread or the async runtime)."""
+        self.upstream.append({"name": name, "ms": round(seconds * 1000, 1), **extra})
+
+    def _stop_cprofile(self):
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler = None
+
+
+class SlowTurnMonitor:
+    def __init__(self, mode=PROFILE_MODE, threshold_ms=SLOW_TURN_MS, directory=PROFILES_DIR, keep=PROFILES_KEEP):
+        self.mode = mode
+        self.threshold_ms = threshold_ms
+        self.directory = directory
+        self.keep = keep
+        self.captured = 0
+        self.cprofile_skipped = 0
+        self.sample_skipped = 0
+        self._cprofile_turn = None      # the one TurnProfile cProfile is attached to
+        self._lock = threading.Lock()
+        self._sampler = _StackSampler(PROFILE_SAMPLE_MS / 1000, PROFILE_MAX_SAMPLED_TURNS)
+
+    @property
+    def enabled(self):
+        return self.mode in ("sample", "cprofile")
+
+    def begin(self, session_id, turn_id):
+        """
+        Start profiling the calling handler's turn; returns None when
+        disabled. Pass the returned TurnProfile to the upstream calls.
+        """
+        if not self.enabled:
+            return None
+        if self.mode == "sample":
+            profile = TurnProfile(self, session_id, turn_id)
+            profile.sampled = self._sampler.add(profile)
+            if not profile.sampled:
+                self.sample_skipped += 1
+            return profile
+        with self._lock:
+            # Concurrent turns would overwrite each other's hook; refuse them
+            owner = self._cprofile_turn is None
+            if not owner:
+                self.cprofile_skipped += 1
+            profile = TurnProfile(self, session_id, turn_id, cprofile=owner)
+            if owner:
+                self._cprofile_turn = profile
+        profile.set_stage("start")
+        return profile
+
+    def end(self, profile, timings=None, error=None):
+        """Stop profiling; persist the profile if the turn was slow. Returns its id or None."""
+        if profile is None:
+            return None
+        self._sampler.remove(profile)
+        profile._stop_cprofile()
+        with self._lock:
+            if self._cprofile_turn is profile:
+                self._cprofile_turn = None
+        total_ms = (time.perf_counter() - profile.started) * 1000
+        if total_ms < self.threshold_ms:
+            return None
+        try:
+            return self._save(profile, total_ms, timings or {}, error)
+        except Exception as e:
+            print(f"❌ Could not save slow-turn profile: {e}")
+            return None
+
+    def _save(self, profile, total_ms, timings, error):
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{profile.session_id[:8]}-{profile.turn_id}"
+        if self.mode == "sample":
+            profile_files = [f"{profile_id}.folded"]
+            with open(os.path.join(self.directory, profile_files[0]), "w", encoding="utf-8") as f:
+                for (stage, stack), count in profile.samples.most_common():
+                    f.write(f"{_collapse(stage, stack)} {count}\n")
+        else:
+            profile_files = []
+            for stage, stage_profile in profile.stage_profiles.items():
+                stage_profile.create_stats()
+                if stage_profile.stats:
+                    profile_files.append(f"{profile_id}.{stage}.prof")
+                    stage_profile.dump_stats(os.path.join(self.directory, profile_files[-1]))
+        meta = {
+            "id": profile_id,
+            "ts": time.time(),
+            "session": profile.session_id,
+            "turn_id": profile.turn_id,
+            "mode": self.mode,
+            "total_ms": round(total_ms, 1),
+            "threshold_ms": self.threshold_ms,
+            "timings_ms": {stage: round(seconds * 1000, 1) for stage, seconds in timings.items()},
+            "inputs": profile.inputs,
+            "upstream": profile.upstream,
+            "samples": sum(profile.samples.values()),
+            # False when other turns held the profiler/sampler: timings only
+            "profiled": profile.sampled or profile.cprofile,
+            "error": error,
+            "profile_files": profile_files,
+        }
+        with open(os.path.join(self.directory, f"{profile_id}.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        self.captured += 1
+        print(f"🐢 Slow turn {profile.turn_id} ({total_ms:.0f} ms) profiled as {profile_id}")
+        self.prune()
+        return profile_id
+
+    def list(self, limit=50):
+        """Metadata of the most recent profiles, newest first."""
+        try:
+            names = sorted((name for name in os.listdir(self.directory) if name.endswith(".json")), reverse=True)
+        except OSError:
+            return []
+        profiles = []
+        for name in names[:limit]:
+            try:
+                with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return profiles
+
+    def prune(self):
+        try:
+            names = sorted(name for name in os.listdir(self.directory) if name.endswith(".json"))
+        except OSError:
+            return
+        expired = {name[:-len(".json")] for name in names[:max(0, len(names) - self.keep)]}
+        if not expired:
+            return
+        for name in os.listdir(self.directory):
+            if name.split(".", 1)[0] in expired:
+                try:
+                    os.unlink(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+
+slow_turns = SlowTurnMonitor()
@@ -0,0 +1,208 @@
+# recorder.py
+# -*- coding: utf-8 -*-
+"""
+Append-only recording of avatar turns for quality analysis and replay.
+
+One segment file per day holds the turns back to back:
+
+    b"TURN" | uint32 meta length | uint32 audio length | JSON meta | zlib(PCM)
+
+and a sibling NDJSON index (one line per turn: session, turn id, offset)
+allows looking up a session's turns without scanning the segment.
+
+Days older than RECORDINGS_KEEP_DAYS are deleted whenever a new day's
+segment is started (0 keeps everything).
+"""
+import io
+import json
+import os
+import queue
+import struct
+import threading
+import time
+import wave
+import zlib
+
+RECORDING_ENABLED = os.environ.get("RECORD_TURNS", "0") == "1"
+RECORDINGS_DIR = os.environ.get("RECORDINGS_DIR", "recordings")
+RECORDINGS_KEEP_DAYS = int(os.environ.get("RECORDINGS_KEEP_DAYS", "30"))
+
+_RECORD_MAGIC = b"TURN"
+_HEADER = struct.Struct(">4sII")
+
+
+def _day(ts):
+    return time.strftime("%Y-%m-%d", time.gmtime(ts))
+
+
+def _pcm_from_wav(wav_bytes):
+    with wave.open(io.BytesIO(wav_bytes), "rb") as wav:
+        return wav.readframes(wav.getnframes()), wav.getframerate(), wav.getnchannels(), wav.getsampwidth()
+
+
+class TurnRecorder:
+    """
+    Records turns through a bounded queue drained by one writer thread, so
+    compression and disk I/O never run on the socket handler.
+    Turns are dropped (and counted) if the writer falls behind.
+    """
+
+    def __init__(self, directory=RECORDINGS_DIR, max_pending=256, keep_days=RECORDINGS_KEEP_DAYS):
+        self.directory = directory
+        self.keep_days = keep_days
+        self.dropped = 0
+        self._day = None    # day of the segment written last
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._write_loop, name="turn-recorder", daemon=True)
+                self._thread.start()
+
+    def record(self, session_id, turn_id, wav_bytes, transcript=None, reply=None,
+               tts_audio_refs=None, timings=None, error=None):
+        """
+        Queue one turn for writing; never blocks the caller.
+
+        `tts_audio_refs` are the tts_cache digests of the reply clips in
+        playback order (each served as /audio/<digest>.mp3).
+        """
+        self._ensure_writer()
+        item = {
+            "session": session_id,
+            "turn_id": turn_id,
+            "ts": time.time(),
+            "transcript": transcript,
+            "reply": reply,
+            "tts_audio_refs": tts_audio_refs or [],
+            "timings": timings or {},
+            "error": error,
+        }
+        try:
+            self._queue.put_nowait((item, wav_bytes))
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far is on disk (used by tools/tests)."""
+        done = threading.Event()
+        self._ensure_writer()
+        self._queue.put((None, done))
+        return done.wait(timeout)
+
+    def _write_loop(self):
+        while True:
+            meta, payload = self._queue.get()
+            if meta is None:
+                payload.set()
+                continue
+            try:
+                self._write(meta, payload)
+            except Exception as e:
+                print(f"❌ Turn recording failed: {e}")
+
+    def _write(self, meta, wav_bytes):
+        audio = b""
+        if wav_bytes:
+            pcm, rate, channels, width = _pcm_from_wav(wav_bytes)
+            meta.update(sample_rate=rate, channels=channels, sample_width=width)
+            audio = zlib.compress(pcm, 6)
+        meta_bytes = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+
+        os.makedirs(self.directory, exist_ok=True)
+        day = _day(meta["ts"])
+        if day != self._day:
+            self._day = day
+            self.prune()
+        segment_path = os.path.join(self.directory, f"{day}.seg")
+        with open(segment_path, "ab") as segment:
+            offset = segment.tell()
+            segment.write(_HEADER.pack(_RECORD_MAGIC, len(meta_bytes), len(audio)))
+            segment.write(meta_bytes)
+            segment.write(audio)
+
+        entry = {"session": meta["session"], "turn_id": meta["turn_id"], "ts": meta["ts"], "offset": offset}
+        with open(os.path.join(self.directory, f"{day}.idx"), "a", encoding="utf-8") as index:
+            index.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    def prune(self):
+        """Delete the segments and indexes of days older than keep_days."""
+        if self.keep_days <= 0:
+            return
+        cutoff = _day(time.time() - self.keep_days * 86400)
+        for day in list_days(self.directory):
+            if day >= cutoff:
+                continue
+            for suffix in (".seg", ".idx"):
+                try:
+                    os.unlink(os.path.join(self.directory, f"{day}{suffix}"))
+                except OSError:
+                    pass
+
+
+turn_recorder = TurnRecorder()
+
+
+# ------------------------------
+# Reading recordings back
+# ------------------------------
+
+def list_days(directory=RECORDINGS_DIR):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[:-4] for name in os.listdir(directory) if name.endswith(".seg"))
+
+
+def read_index(day, directory=RECORDINGS_DIR, session_id=None):
+    path = os.path.join(directory, f"{day}.idx")
+    if not os.path.exists(path):
+        return []
+    entries = []
+    with open(path, encoding="utf-8") as index:
+        for line in index:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if session_id is None or entry["session"] == session_id:
+                entries.append(entry)
+    return entries
+
+
+def read_turn(segment, offset):
+    """
+    Read one turn from an open segment file.
+
+    :return: (meta dict, PCM bytes)
+    """
+    segment.seek(offset)
+    magic, meta_len, audio_len = _HEADER.unpack(segment.read(_HEADER.size))
+    if magic != _RECORD_MAGIC:
+        raise ValueError(f"No turn record at offset {offset}")
+    meta = json.loads(segment.read(meta_len).decode("utf-8"))
+    audio = segment.read(audio_len)
+    return meta, zlib.decompress(audio) if audio else b""
+
+
+def iter_turns(day, directory=RECORDINGS_DIR, session_id=None):
+    """Yield (meta, PCM bytes) for the turns of `day`, optionally one session only."""
+    entries = read_index(day, directory, session_id)
+    if not entries:
+        return
+    with open(os.path.join(directory, f"{day}.seg"), "rb") as segment:
+        for entry in entries:
+            yield read_turn(segment, entry["offset"])
+
+
+def pcm_to_wav(pcm, sample_rate=16000, channels=1, sample_width=2):
+    """Wrap recorded PCM back into an in-memory WAV buffer."""
+    wav_buffer = io.BytesIO()
+    with wave.open(wav_buffer, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(sample_width)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    wav_buffer.seek(0)
+    return wav_buffer
@@ -0,0 +1,302 @@
+# replay.py
+# -*- coding: utf-8 -*-
+"""
+Replay recorded avatar turns through the decode -> ASR -> LLM -> TTS stages
+for regression benchmarking.
+
+    python -m app.utils.replay --day 2024-05-01
+    python -m app.utils.replay --day 2024-05-01 --session <sid> --mode realtime
+    python -m app.utils.replay --day 2024-05-01 --compare "asr=google"
+
+A configuration is a comma separated list of stage=backend pairs:
+
+    decode  ffmpeg (same pydub/ffmpeg path as the server) | wav
+    asr     recorded (replays the recorded transcript) | google |
+            sphinx (local; needs `pip install pocketsphinx`)
+    llm     echo (replays the recorded reply) | hkbu
+    tts     null | gtts | edge
+
+plus `llm_latency_ms` / `tts_latency_ms` to give the echo/null stand-ins a
+fixed delay. The default runs entirely locally, with no extra packages.
+WER is only reported for a real ASR backend (`recorded` would compare the
+transcript with itself). Turns that fail are listed with their error
+under the report.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import speech_recognition as sr
+
+from app.utils.recorder import RECORDINGS_DIR, iter_turns, pcm_to_wav
+from app.utils.speculative import normalize_transcript
+from app.utils.tts_text import prepare_speech
+
+DEFAULT_CONFIG = "decode=ffmpeg,asr=recorded,llm=echo,tts=null"
+STAGES = ("decode", "asr", "llm", "tts")
+
+
+def parse_config(spec):
+    config = dict(item.split("=", 1) for item in DEFAULT_CONFIG.split(","))
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        key, _, value = item.partition("=")
+        config[key.strip()] = value.strip()
+    return config
+
+
+def word_error_rate(reference, hypothesis):
+    """Word-level Levenshtein distance divided by the reference length."""
+    ref = normalize_transcript(reference).split()
+    hyp = normalize_transcript(hypothesis).split()
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_word != hyp_word),
+            ))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[rank]
+
+
+# ------------------------------
+# Pipeline stages
+# ------------------------------
+
+class ReplayPipeline:
+    """The server's stages, or local stand-ins, selected by a config dict."""
+
+    def __init__(self, config):
+        self.config = config
+        # Imported lazily so `--help` works without the server's dependencies
+        from app.utils import speech
+        self._speech = speech
+        self._server_module = None
+
+    @property
+    def _server(self):
+        """The avatar router, for the LLM and TTS backends only (it loads the whole app)."""
+        if self._server_module is None:
+            from app.routers import streaming_avatar
+            self._server_module = streaming_avatar
+        return self._server_module
+
+    @property
+    def measures_wer(self):
+        return self.config["asr"] != "recorded"
+
+    def decode(self, meta, pcm):
+        wav = pcm_to_wav(pcm, meta.get("sample_rate", 16000), meta.get("channels", 1), meta.get("sample_width", 2))
+        if self.config["decode"] == "wav":
+            return wav
+        return self._speech.convert_audio_to_wav(wav.getvalue(), source_format="wav")
+
+    def recognize(self, meta, wav_buffer):
+        backend = self.config["asr"]
+        if backend == "recorded":
+            return meta.get("transcript") or ""
+        if backend == "google":
+            return self._speech.recognize_speech(wav_buffer)
+        if backend == "sphinx":
+            recognizer = sr.Recognizer()
+            with sr.AudioFile(wav_buffer) as source:
+                audio_clip = recognizer.record(source)
+            return recognizer.recognize_sphinx(audio_clip)
+        raise ValueError(f"Unknown asr backend: {backend}")
+
+    def respond(self, meta, text):
+        backend = self.config["llm"]
+        if backend == "echo":
+            time.sleep(float(self.config.get("llm_latency_ms", 0)) / 1000)
+            return meta.get("reply") or ""
+        if backend == "hkbu":
+            return self._server.get_llm_response(text)
+        raise ValueError(f"Unknown llm backend: {backend}")
+
+    def synthesize(self, reply):
+        backend = self.config["tts"]
+        if backend == "null":
+            time.sleep(float(self.config.get("tts_latency_ms", 0)) / 1000)
+            return b""
+        if backend == "gtts":
+            return b"".join(self._server.text_to_speech_gtts(unit) or b"" for unit in prepare_speech(reply, "gtts"))
+        if backend == "edge":
+            return b"".join(asyncio.run(self._server.text_to_speech_edge(unit)) or b"" for unit in prepare_speech(reply, "edge"))
+        raise ValueError(f"Unknown tts backend: {backend}")
+
+    def run_turn(self, meta, pcm):
+        result = {"session": meta["session"], "turn_id": meta["turn_id"], "timings": {}, "error": None}
+        timings = result["timings"]
+        stage = "decode"
+        try:
+            stage_start = time.perf_counter()
+            wav_buffer = self.decode(meta, pcm)
+            timings["decode"] = time.perf_counter() - stage_start
+
+            stage, stage_start = "asr", time.perf_counter()
+            try:
+                text = self.recognize(meta, wav_buffer)
+            except sr.UnknownValueError:
+                text = ""
+            timings["asr"] = time.perf_counter() - stage_start
+            result["transcript"] = text
+            if meta.get("transcript") and self.measures_wer:
+                result["wer"] = word_error_rate(meta["transcript"], text)
+
+            stage, stage_start = "llm", time.perf_counter()
+            reply = self.respond(meta, text)
+            timings["llm"] = time.perf_counter() - stage_start
+
+            stage, stage_start = "tts", time.perf_counter()
+            self.synthesize(reply or "")
+            timings["tts"] = time.perf_counter() - stage_start
+        except Exception as e:
+            result["error"] = f"{stage}: {e or type(e).__name__}"
+        return result
+
+
+# ------------------------------
+# Scheduling and reporting
+# ------------------------------
+
+def load_turns(day, directory=RECORDINGS_DIR, session_id=None, limit=None):
+    turns = []
+    for meta, pcm in iter_turns(day, directory, session_id):
+        if not pcm:
+            continue  # turn failed before decoding; nothing to replay
+        turns.append((meta, pcm))
+        if limit and len(turns) >= limit:
+            break
+    turns.sort(key=lambda turn: turn[0]["ts"])
+    return turns
+
+
+def replay(turns, pipeline, mode="compressed", speed=1.0, workers=4):
+    """
+    Run every turn through `pipeline`. In "compressed" mode turns start
+    back to back, `workers` at a time. In "realtime" mode each turn is
+    submitted at its recorded inter-arrival time (divided by `speed`), to
+    a pool that grows with the overlap so no arrival waits for a worker.
+    """
+    results = [None] * len(turns)
+    first_ts = turns[0][0]["ts"] if turns else 0
+    lock = threading.Lock()
+
+    def run(i, meta, pcm):
+        result = pipeline.run_turn(meta, pcm)
+        with lock:
+            results[i] = result
+
+    # Idle threads are reused, so the realtime pool only reaches the peak overlap
+    max_workers = max(1, len(turns)) if mode == "realtime" else workers
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        started = time.perf_counter()
+        for i, (meta, pcm) in enumerate(turns):
+            if mode == "realtime":
+                delay = (meta["ts"] - first_ts) / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            pool.submit(run, i, meta, pcm)
+    return results
+
+
+def summarize(results, recorded_meta):
+    report = {"turns": len(results), "errors": sum(1 for r in results if r["error"]), "stages": {}}
+    for stage in STAGES + ("total",):
+        if stage == "total":
+            values = [sum(r["timings"].values()) for r in results if not r["error"]]
+        else:
+            values = [r["timings"][stage] for r in results if stage in r["timings"]]
+        if values:
+            report["stages"][stage] = {
+                "mean": sum(values) / len(values),
+                "p50": percentile(values, 50),
+                "p90": percentile(values, 90),
+                "p99": percentile(values, 99),
+                "max": max(values),
+            }
+    wers = [r["wer"] for r in results if "wer" in r]
+    report["mean_wer"] = sum(wers) / len(wers) if wers else None
+    report["worst"] = [
+        {"session": r["session"], "turn_id": r["turn_id"], "wer": r["wer"],
+         "recorded": meta.get("transcript"), "replayed": r.get("transcript")}
+        for r, meta in sorted(zip(results, recorded_meta), key=lambda pair: -pair[0].get("wer", 0))[:5]
+        if r.get("wer")
+    ]
+    report["failed"] = [
+        {"session": r["session"], "turn_id": r["turn_id"], "error": r["error"]}
+        for r in results if r["error"]
+    ]
+    return report
+
+
+def print_report(name, config, report):
+    print(f"\n=== {name}: {','.join(f'{k}={v}' for k, v in sorted(config.items()))} ===")
+    mean_wer = "n/a" if report["mean_wer"] is None else f"{report['mean_wer']:.3f}"
+    print(f"turns: {report['turns']}  errors: {report['errors']}  mean WER: {mean_wer}")
+    print(f"{'stage':<8}{'mean':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}  (ms)")
+    for stage, stats in report["stages"].items():
+        print(f"{stage:<8}" + "".join(f"{stats[key] * 1000:>9.1f}" for key in ("mean", "p50", "p90", "p99", "max")))
+    for worst in report["worst"]:
+        print(f"  WER {worst['wer']:.2f} {worst['session']}#{worst['turn_id']}: "
+              f"'{worst['recorded']}' -> '{worst['replayed']}'")
+    for failed in report["failed"][:10]:
+        print(f"  ERROR {failed['session']}#{failed['turn_id']}: {failed['error']}")
+    if len(report["failed"]) > 10:
+        print(f"  ... and {len(report['failed']) - 10} more failed turns (see --json)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded avatar turns for benchmarking")
+    parser.add_argument("--day", required=True, help="recording day (YYYY-MM-DD)")
+    parser.add_argument("--dir", default=RECORDINGS_DIR, help="recordings directory")
+    parser.add_argument("--session", help="only replay this session id")
+    parser.add_argument("--limit", type=int, help="replay at most this many turns")
+    parser.add_argument("--mode", choices=("compressed", "realtime"), default="compressed")
+    parser.add_argument("--speed", type=float, default=1.0, help="realtime mode speed-up factor")
+    parser.add_argument("--workers", type=int, default=4, help="turns replayed concurrently (compressed mode)")
+    parser.add_argument("--config", default="", help=f"pipeline config (default {DEFAULT_CONFIG})")
+    parser.add_argument("--compare", help="second pipeline config to A/B against --config")
+    parser.add_argument("--json", action="store_true", help="print the reports as JSON")
+    args = parser.parse_args(argv)
+
+    turns = load_turns(args.day, args.dir, args.session, args.limit)
+    if not turns:
+        print(f"No recorded turns for {args.day} in {args.dir}")
+        return 1
+    metas = [meta for meta, _ in turns]
+
+    configs = [("A", parse_config(args.config))]
+    if args.compare is not None:
+        configs.append(("B", parse_config(args.compare)))
+
+    reports = {}
+    for name, config in configs:
+        results = replay(turns, ReplayPipeline(config), args.mode, args.speed, args.workers)
+        reports[name] = {"config": config, **summarize(results, metas)}
+        if not args.json:
+            print_report(name, config, reports[name])
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,252 @@
+# sessions.py
+# -*- coding: utf-8 -*-
+"""
+Per-socket session state with explicit memory accounting.
+
+Every connected socket gets one `Session` (tenant, in-flight turn,
+speculative partial audio). Sessions use __slots__ and allocate their audio
+buffer only while the student is speaking, so an idle connection costs a
+fixed, small amount of memory.
+
+All audio buffered by sessions counts against SESSION_MEMORY_BUDGET_MB.
+When a new chunk would exceed the budget, idle sessions are downgraded
+first (their partial audio and speculative request are dropped); if that
+still isn't enough the chunk is refused and the sender is downgraded
+instead. Speculative audio is optional, so no socket is ever disconnected
+to make room for it: a downgraded utterance simply takes the normal path.
+"""
+import array
+import itertools
+import os
+import sys
+import threading
+import time
+
+from app.utils.turns import Turn
+
+SESSION_MEMORY_BUDGET_BYTES = int(float(os.environ.get("SESSION_MEMORY_BUDGET_MB", "256")) * 1024 * 1024)
+# Partial audio a single session may buffer (~2 min of 24 kbit/s opus)
+SESSION_MAX_PARTIAL_BYTES = int(os.environ.get("SESSION_MAX_PARTIAL_BYTES", str(384 * 1024)))
+# A session that sent nothing for this long may lose its partial audio
+SESSION_IDLE_SECONDS = float(os.environ.get("SESSION_IDLE_SECONDS", "30"))
+
+
+class AudioBuffer:
+    """Growable byte buffer backed by array('B'); reports its real allocation."""
+
+    __slots__ = ("_data",)
+
+    def __init__(self):
+        self._data = array.array("B")
+
+    def extend(self, chunk):
+        self._data.frombytes(chunk)
+
+    def tobytes(self):
+        return self._data.tobytes()
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def nbytes(self):
+        return sys.getsizeof(self._data)
+
+
+class Session:
+    __slots__ = ("sid", "tenant", "turn", "partial", "partial_transcribed", "speculator",
+                 "transcribing", "degraded", "last_active")
+
+    def __init__(self, sid, tenant):
+        self.sid = sid
+        self.tenant = tenant
+        self.turn = None            # in-flight Turn, if any
+        self.partial = None         # AudioBuffer while speculative chunks arrive
+        self.partial_transcribed = 0    # partial bytes covered by the last transcription
+        self.speculator = None
+        self.transcribing = False   # a partial transcription is running
+        self.degraded = False       # speculative buffering switched off under memory pressure
+        self.last_active = time.monotonic()
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    def release_partial(self):
+        """Drop buffered partial audio and any speculative request."""
+        self.partial = None
+        self.partial_transcribed = 0
+        speculator, self.speculator = self.speculator, None
+        if speculator is not None:
+            speculator.discard()
+
+
+# Size of the Session object alone; the socket.io/engine.io state of the
+# connection comes on top and isn't counted here
+SESSION_OBJECT_BYTES = sys.getsizeof(Session("", None))
+EMPTY_BUFFER_BYTES = AudioBuffer().nbytes
+
+
+class SessionRegistry:
+    """
+    All sessions of the socket namespace, their turns and their memory.
+
+    Starting a new turn cancels the session's previous one (barge-in), so
+    only the latest utterance ever reaches the client.
+    """
+
+    def __init__(self, budget_bytes=SESSION_MEMORY_BUDGET_BYTES, max_partial_bytes=SESSION_MAX_PARTIAL_BYTES,
+                 idle_seconds=SESSION_IDLE_SECONDS):
+        self.budget_bytes = budget_bytes
+        self.max_partial_bytes = max_partial_bytes
+        self.idle_seconds = idle_seconds
+        self._sessions = {}
+        self._buffered = 0          # sum of partial buffer allocations
+        self._lock = threading.Lock()
+        self._turn_ids = itertools.count(1)
+        self.downgrades = 0
+
+    # --- lifecycle ---
+
+    def open(self, sid, tenant):
+        session = Session(sid, tenant)
+        with self._lock:
+            self._sessions[sid] = session
+        return session
+
+    def get(self, sid):
+        return self._sessions.get(sid)
+
+    def close(self, sid):
+        """Cancel and forget everything for a disconnected session."""
+        with self._lock:
+            session = self._sessions.pop(sid, None)
+            if session is None:
+                return
+            self._release_locked(session)
+            turn, session.turn = session.turn, None
+        if turn is not None:
+            turn.cancel()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    # --- turns ---
+
+    def start_turn(self, session):
+        turn = Turn(session.sid, next(self._turn_ids))
+        with self._lock:
+            previous, session.turn = session.turn, turn
+            # The full utterance supersedes partial audio and re-enables speculation
+            self._release_locked(session)
+            session.degraded = False
+        session.touch()
+        if previous is not None:
+            previous.cancel()
+        return turn
+
+    def cancel_turn(self, session, turn_id=None):
+        """
+        Cancel the session's active turn. If `turn_id` is given, only cancel
+        when it is still the active one.
+
+        :return: the cancelled turn id, or None if nothing was cancelled
+        """
+        with self._lock:
+            turn = session.turn
+            if turn is None or (turn_id is not None and turn.turn_id != turn_id):
+                return None
+            session.turn = None
+        turn.cancel()
+        return turn.turn_id
+
+    def finish_turn(self, session, turn):
+        with self._lock:
+            if session.turn is turn:
+                session.turn = None
+
+    # --- partial audio ---
+
+    def reset_partial(self, session):
+        """A new recording starts: forget the previous utterance's partials."""
+        with self._lock:
+            self._release_locked(session)
+            session.degraded = False
+
+    def take_speculator(self, session):
+        """Hand the session's speculative request over to the final turn."""
+        with self._lock:
+            speculator, session.speculator = session.speculator, None
+        return speculator
+
+    def append_partial(self, session, chunk):
+        """
+        Buffer a speculative audio chunk, enforcing the per-session cap and
+        the global budget. Returns False (and downgrades the session) when
+        the chunk can't be kept.
+        """
+        session.touch()
+        with self._lock:
+            if session.degraded:
+                return False
+            buffered = len(session.partial) if session.partial is not None else 0
+            needed = len(chunk) + (EMPTY_BUFFER_BYTES if session.partial is None else 0)
+            if buffered + len(chunk) <= self.max_partial_bytes and not self._fits_locked(needed):
+                self._reclaim_idle_locked(needed, exclude=session)
+            if buffered + len(chunk) > self.max_partial_bytes or not self._fits_locked(needed):
+                self._downgrade_locked(session)
+                return False
+            before = session.partial.nbytes if session.partial is not None else 0
+            if session.partial is None:
+                session.partial = AudioBuffer()
+            session.partial.extend(chunk)
+            self._buffered += session.partial.nbytes - before
+            return True
+
+    # --- accounting ---
+
+    def memory_bytes(self):
+        return len(self._sessions) * SESSION_OBJECT_BYTES + self._buffered
+
+    def stats(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {
+            "sessions": len(sessions),
+            "active_turns": sum(1 for session in sessions if session.turn is not None),
+            "buffering": sum(1 for session in sessions if session.partial is not None),
+            "degraded": sum(1 for session in sessions if session.degraded),
+            "memory_bytes": self.memory_bytes(),
+            "buffered_bytes": self._buffered,
+            "budget_bytes": self.budget_bytes,
+            "session_object_bytes": SESSION_OBJECT_BYTES,
+            "downgrades": self.downgrades,
+        }
+
+    def _fits_locked(self, extra):
+        return self._buffered + extra <= self.budget_bytes
+
+    def _release_locked(self, session):
+        if session.partial is not None:
+            self._buffered -= session.partial.nbytes
+        session.release_partial()
+
+    def _downgrade_locked(self, session):
+        self._release_locked(session)
+        session.degraded = True
+        self.downgrades += 1
+
+    def _reclaim_idle_locked(self, needed, exclude):
+        """Drop the partial audio of idle sessions, longest idle first."""
+        cutoff = time.monotonic() - self.idle_seconds
+        idle = sorted(
+            (session for session in self._sessions.values()
+             if session is not exclude and session.partial is not None and session.last_active < cutoff),
+            key=lambda session: session.last_active,
+        )
+        for session in idle:
+            if self._fits_locked(needed):
+                return
+            self._downgrade_locked(session)
+
+
+session_registry = SessionRegistry()
@@ -0,0 +1,193 @@
+# speculative.py
+# -*- coding: utf-8 -*-
+import difflib
+import os
+import re
+import threading
+
+# Opt-in: start the LLM request before the student has finished speaking
+SPECULATIVE_LLM_ENABLED = os.environ.get("SPECULATIVE_LLM", "0") == "1"
+SIMILARITY_THRESHOLD = float(os.environ.get("SPECULATIVE_SIMILARITY", "0.9"))
+# How many identical partial transcripts in a row count as "stable"
+STABLE_PARTIALS = int(os.environ.get("SPECULATIVE_STABLE_PARTIALS", "2"))
+# Each partial transcription decodes and recognizes the whole buffer so far:
+# space them this much new audio apart, and stop past the maximum (longer
+# utterances simply take the normal path)
+PARTIAL_STEP_SECONDS = float(os.environ.get("SPECULATIVE_STEP_SECONDS", "1.5"))
+PARTIAL_MAX_SECONDS = float(os.environ.get("SPECULATIVE_MAX_SECONDS", "15"))
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+def normalize_transcript(text: str) -> str:
+    """Lowercase and strip punctuation so cosmetic ASR changes don't matter."""
+    return " ".join(_WORD_RE.findall((text or "").lower()))
+
+
+def transcript_similarity(a: str, b: str) -> float:
+    """Word-level similarity ratio between two transcripts (0.0 - 1.0)."""
+    words_a = normalize_transcript(a).split()
+    words_b = normalize_transcript(b).split()
+    if not words_a and not words_b:
+        return 1.0
+    return difflib.SequenceMatcher(None, words_a, words_b).ratio()
+
+
+def partial_due(buffered_bytes, transcribed_bytes, bytes_per_second) -> bool:
+    """Whether a partial buffer has grown enough to be worth transcribing again."""
+    if buffered_bytes > PARTIAL_MAX_SECONDS * bytes_per_second:
+        return False
+    return buffered_bytes - transcribed_bytes >= PARTIAL_STEP_SECONDS * bytes_per_second
+
+
+def estimate_tokens(text) -> int:
+    """Rough token count (~4 characters per token) for wasted-work accounting."""
+    return (len(text) + 3) // 4 if text else 0
+
+
+class SpeculationMetrics:
+    """Process-wide counters for the speculative LLM path."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.launched = 0
+        self.hits = 0
+        self.misses = 0
+        self.wasted_tokens = 0
+
+    def record(self, launched=0, hits=0, misses=0, wasted_tokens=0):
+        with self._lock:
+            self.launched += launched
+            self.hits += hits
+            self.misses += misses
+            self.wasted_tokens += wasted_tokens
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            resolved = self.hits + self.misses
+            return {
+                "launched": self.launched,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / resolved if resolved else 0.0,
+                "wasted_tokens": self.wasted_tokens,
+            }
+
+
+speculation_metrics = SpeculationMetrics()
+
+
+class _Prefetch:
+    def __init__(self, text):
+        self.text = text
+        self.cancel_event = threading.Event()
+        self.done = threading.Event()
+        self.result = None
+        self.generated_tokens = 0   # streamed so far, cancelled or not
+        self.abandoned = False
+        self.lock = threading.Lock()
+
+    def on_delta(self, delta):
+        self.generated_tokens += estimate_tokens(delta)
+
+
+class SpeculativeLLM:
+    """
+    Per-session speculative LLM request driven by partial transcripts.
+
+    `fetch(text, cancel_event, on_delta)` must behave like
+    `get_llm_response`: call `on_delta` with each streamed piece of the
+    reply and return the reply text, or None once `cancel_event` is set.
+    Replies for which `failed(reply)` is true (fallback phrases) are never
+    served; they count as misses so the caller reissues the request.
+    """
+
+    def __init__(self, fetch, threshold=SIMILARITY_THRESHOLD, stable_partials=STABLE_PARTIALS, failed=None):
+        self._fetch = fetch
+        self._failed = failed
+        self.threshold = threshold
+        self.stable_partials = stable_partials
+        self._last_partial = None
+        self._repeats = 0
+        self._prefetch = None
+
+    def observe_partial(self, text):
+        """
+        Feed the latest partial transcript. Launches (or relaunches) the
+        prefetch once the same transcript has been seen `stable_partials`
+        times in a row.
+
+        :return: True if a new prefetch was started
+        """
+        normalized = normalize_transcript(text)
+        if not normalized:
+            return False
+        if normalized == self._last_partial:
+            self._repeats += 1
+        else:
+            self._last_partial = normalized
+            self._repeats = 1
+        if self._repeats < self.stable_partials:
+            return False
+        if self._prefetch is not None and self._prefetch.text == normalized:
+            return False
+
+        self.discard()
+        prefetch = _Prefetch(normalized)
+        self._prefetch = prefetch
+        speculation_metrics.record(launched=1)
+        threading.Thread(target=self._run, args=(prefetch, text), daemon=True).start()
+        return True
+
+    def _run(self, prefetch, text):
+        try:
+            prefetch.result = self._fetch(text, prefetch.cancel_event, prefetch.on_delta)
+        except Exception as e:
+            print(f"Speculative LLM Error: {e}")
+        finally:
+            with prefetch.lock:
+                prefetch.done.set()
+                abandoned = prefetch.abandoned
+            if abandoned:
+                # Cancelled mid-stream: whatever was generated is wasted
+                speculation_metrics.record(wasted_tokens=prefetch.generated_tokens)
+
+    def resolve(self, final_text, timeout=10):
+        """
+        Reuse the prefetched reply if it was issued for (nearly) the final
+        transcript. Otherwise cancel it and return None so the caller reissues.
+        """
+        prefetch, self._prefetch = self._prefetch, None
+        self._last_partial, self._repeats = None, 0
+        if prefetch is None:
+            return None
+
+        similarity = transcript_similarity(prefetch.text, final_text)
+        if similarity >= self.threshold and prefetch.done.wait(timeout) and self._usable(prefetch.result):
+            speculation_metrics.record(hits=1)
+            print(f"⚡ Speculative LLM hit (similarity {similarity:.2f})")
+            return prefetch.result
+
+        self._abandon(prefetch)
+        speculation_metrics.record(misses=1)
+        print(f"🔁 Speculative LLM miss (similarity {similarity:.2f})")
+        return None
+
+    def _usable(self, reply):
+        return reply is not None and not (self._failed is not None and self._failed(reply))
+
+    def discard(self):
+        """Cancel any outstanding prefetch without counting a hit or miss."""
+        prefetch, self._prefetch = self._prefetch, None
+        if prefetch is not None:
+            self._abandon(prefetch)
+
+    def _abandon(self, prefetch):
+        prefetch.cancel_event.set()
+        with prefetch.lock:
+            prefetch.abandoned = True
+            done = prefetch.done.is_set()
+        if done:
+            # The upstream already generated the whole reply for nothing;
+            # otherwise _run() records the tokens once the fetch stops
+            speculation_metrics.record(wasted_tokens=prefetch.generated_tokens)
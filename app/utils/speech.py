@@ -0,0 +1,121 @@
+# speech.py
+# -*- coding: utf-8 -*-
+"""
+Audio decoding and speech recognition shared by the socket handlers and
+the batch transcription workers.
+
+Batch workers are spawned processes that import this module on their own,
+so it must stay free of import-time side effects (no app, sockets,
+threads or warm-up).
+"""
+import io
+import os
+import time
+
+import numpy as np
+import speech_recognition as sr
+from pydub import AudioSegment
+from scipy.signal import resample
+
+from app.utils.phrase_audio import PHRASES
+from app.utils.recorder import pcm_to_wav
+
+# Extensions ffmpeg should be told about; anything else is probed
+AUDIO_FORMATS = {"webm", "wav", "mp3", "ogg", "oga", "m4a", "mp4", "flac", "aac"}
+
+
+def convert_audio_to_wav(audio_bytes, source_format="webm"):
+    """
+    CORE SOLUTION: Convert WebM to WAV using pydub + ffmpeg
+
+    Returns an in-memory WAV buffer (mono, 16kHz, 16-bit) ready for the
+    speech recognizer.
+    """
+    # Step 1: Load WebM audio with pydub (requires ffmpeg)
+    audio_segment = AudioSegment.from_file(
+        io.BytesIO(audio_bytes),
+        format=source_format
+    )
+    print(f"✅ WebM loaded: {len(audio_segment)}ms, {audio_segment.frame_rate}Hz, {audio_segment.channels} channels")
+
+    # Step 2: Optimize for speech recognition
+    # Convert to mono, 16kHz, 16-bit (ideal for speech recognition)
+    audio_segment = audio_segment.set_channels(1)        # Mono
+    audio_segment = audio_segment.set_frame_rate(16000)  # 16kHz
+    audio_segment = audio_segment.set_sample_width(2)    # 16-bit
+
+    # Step 3: Export to WAV format in memory
+    wav_buffer = io.BytesIO()
+    audio_segment.export(
+        wav_buffer,
+        format="wav",
+        parameters=["-acodec", "pcm_s16le"]  # Ensure PCM encoding
+    )
+    wav_buffer.seek(0)
+
+    print(f"✅ Converted to WAV: {len(wav_buffer.getvalue())} bytes")
+    return wav_buffer
+
+
+def convert_pcm_to_wav(pcm_bytes, sample_rate=16000, channels=1):
+    """
+    Raw 16-bit PCM from the AudioWorklet capture path. Already at the
+    recognizer's format in the normal case, so ffmpeg is skipped entirely.
+    """
+    samples = np.frombuffer(pcm_bytes, dtype=np.int16)
+    if channels > 1:
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    if sample_rate != 16000 and len(samples):
+        samples = resample(samples, int(len(samples) * 16000 / sample_rate))
+    if samples.dtype != np.int16:
+        samples = np.clip(samples, -32768, 32767).astype(np.int16)
+    print(f"✅ PCM received: {len(samples) / 16000 * 1000:.0f}ms, {sample_rate}Hz, {channels} channels")
+    return pcm_to_wav(samples.tobytes())
+
+
+def recognize_speech(wav_buffer, language='en-US', profile=None):
+    """
+    Run Google speech recognition on a WAV buffer; the request time is
+    noted on the turn's `profile`, if any.
+
+    Raises sr.UnknownValueError / sr.RequestError like the recognizer does.
+    """
+    recognizer = sr.Recognizer()
+    recognizer.energy_threshold = 300
+    recognizer.dynamic_energy_threshold = True
+
+    with sr.AudioFile(wav_buffer) as source:
+        # Adjust for ambient noise
+        recognizer.adjust_for_ambient_noise(source, duration=0.2)
+        # Record the audio
+        audio_clip = recognizer.record(source)
+
+    print("🎯 Audio successfully processed by speech recognizer")
+
+    request_start = time.perf_counter()
+    try:
+        return recognizer.recognize_google(audio_clip, language=language)
+    finally:
+        if profile is not None:
+            profile.note_upstream("google_asr", time.perf_counter() - request_start)
+
+
+def transcribe_clip(name, audio_bytes, language='en-US'):
+    """
+    Decode + recognize one uploaded clip (runs in a batch worker process).
+    Errors are returned per clip instead of raised.
+    """
+    started = time.perf_counter()
+    ext = os.path.splitext(name)[1].lstrip(".").lower()
+    try:
+        wav_buffer = convert_audio_to_wav(audio_bytes, source_format=ext if ext in AUDIO_FORMATS else None)
+        text = recognize_speech(wav_buffer, language=language)
+        result = {'clip': name, 'text': text}
+    except sr.UnknownValueError:
+        result = {'clip': name, 'error': PHRASES["not_understood"]}
+    except sr.RequestError as e:
+        result = {'clip': name, 'error': f'Speech recognition error: {e}'}
+    except Exception as e:
+        result = {'clip': name, 'error': f'Audio format conversion failed: {e}'}
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    return result
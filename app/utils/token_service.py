@@ -5,6 +5,7 @@ import hashlib
 import hmac
 import os
 import requests
+import threading
 import time
 import uuid
 from urllib import parse
@@ -24,12 +25,13 @@ def _encode_dict(dic: dict) -> str:
     return encoded_text.replace('+', '%20').replace('*', '%2A').replace('%7E', '~')
 
 
-def get_alicloud_token(access_key_id: str, access_key_secret: str):
+def get_alicloud_token(access_key_id: str, access_key_secret: str, timeout: float = 10):
     """
     Generate an AliCloud token.
 
     :param access_key_id: AliCloud access key ID
     :param access_key_secret: AliCloud access key secret
+    :param timeout: request timeout in seconds
     :return: (token, expire_time) or (None, None) if failed
     """
     parameters = {
@@ -63,7 +65,7 @@ def get_alicloud_token(access_key_id: str, access_key_secret: str):
 
     # Request token
     full_url = f'http://nlsmeta.ap-southeast-1.aliyuncs.com/?Signature={signature}&{query_string}'
-    response = requests.get(full_url)
+    response = requests.get(full_url, timeout=timeout)
 
     if response.ok:
         root_obj = response.json()
@@ -73,4 +75,57 @@ def get_alicloud_token(access_key_id: str, access_key_secret: str):
             expire_time = root_obj[key]['ExpireTime']
             return token, expire_time
 
-    return None, None
\ No newline at end of file
+    return None, None
+
+
+class AliCloudTokenCache:
+    """Keeps one AliCloud token and renews it shortly before it expires."""
+
+    def __init__(self, access_key_id=None, access_key_secret=None, refresh_margin=300):
+        self.access_key_id = access_key_id
+        self.access_key_secret = access_key_secret
+        self.refresh_margin = refresh_margin
+        self._token = None
+        self._expire_time = 0
+        self._last_error = None
+        self._lock = threading.Lock()
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.access_key_id and self.access_key_secret)
+
+    def get(self):
+        """
+        Return a valid token, requesting a new one if needed.
+
+        :return: token or None if not configured / request failed
+        """
+        if not self.configured:
+            return None
+        with self._lock:
+            if self._token and self._expire_time - time.time() > self.refresh_margin:
+                return self._token
+            try:
+                token, expire_time = get_alicloud_token(self.access_key_id, self.access_key_secret)
+            except Exception as e:
+                token, expire_time = None, None
+                self._last_error = str(e)
+            if token:
+                self._token, self._expire_time, self._last_error = token, int(expire_time), None
+            elif self._last_error is None:
+                self._last_error = "CreateToken returned no token"
+            return token or (self._token if self._expire_time > time.time() else None)
+
+    def status(self) -> dict:
+        return {
+            "configured": self.configured,
+            "has_token": bool(self._token) and self._expire_time > time.time(),
+            "expires_in": max(0, int(self._expire_time - time.time())) if self._token else None,
+            "last_error": self._last_error,
+        }
+
+
+alicloud_tokens = AliCloudTokenCache(
+    os.environ.get("ALICLOUD_ACCESS_KEY_ID"),
+    os.environ.get("ALICLOUD_ACCESS_KEY_SECRET"),
+)
@@ -0,0 +1,177 @@
+# tts_cache.py
+# -*- coding: utf-8 -*-
+"""
+Disk cache of synthesized speech.
+
+Audio is stored once under its content hash (<sha256>.mp3); a small
+reference file per (provider, voice, text) points at it, so identical
+lines from different lesson scripts share one file and one URL.
+
+Batch manifests (manifests/<id>.json) are kept alongside; the batch zip
+is built from one on request, so clips are never stored twice.
+
+Pruning evicts the least recently used audio and manifests, both counted
+against TTS_CACHE_MAX_MB: cache hits refresh a file's mtime, and digests
+pinned by an in-flight batch are never deleted.
+"""
+import contextlib
+import hashlib
+import os
+import threading
+
+TTS_CACHE_DIR = os.environ.get("TTS_CACHE_DIR", os.path.join("cache", "tts"))
+TTS_CACHE_MAX_BYTES = int(float(os.environ.get("TTS_CACHE_MAX_MB", "512")) * 1024 * 1024)
+# Check the size limit every this many writes rather than on each one
+_PRUNE_EVERY = 100
+
+
+def request_key(provider, voice, text):
+    return hashlib.sha256(f"{provider}|{voice}|{text}".encode("utf-8")).hexdigest()
+
+
+def is_digest(value):
+    return len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+
+class TTSCache:
+    def __init__(self, directory=TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._writes = 0
+        self._pins = {}         # id -> set of digests pinned by a pinned() block
+        self._lock = threading.Lock()
+
+    def audio_path(self, digest):
+        return os.path.join(self.directory, f"{digest}.mp3")
+
+    def _ref_path(self, key):
+        return os.path.join(self.directory, "refs", key)
+
+    def _manifest_path(self, manifest_id):
+        return os.path.join(self.directory, "manifests", f"{manifest_id}.json")
+
+    @contextlib.contextmanager
+    def pinned(self):
+        """
+        Yields a set; digests looked up or stored with `pin=` that set are
+        kept out of prune() until the block exits.
+        """
+        pins = set()
+        with self._lock:
+            self._pins[id(pins)] = pins
+        try:
+            yield pins
+        finally:
+            with self._lock:
+                del self._pins[id(pins)]
+
+    def lookup(self, provider, voice, text, pin=None):
+        """Content digest of cached audio for this request, or None."""
+        try:
+            with open(self._ref_path(request_key(provider, voice, text)), encoding="ascii") as ref:
+                digest = ref.read().strip()
+        except OSError:
+            return None
+        with self._lock:
+            # Checked under the lock so prune() can't delete it in between
+            if not self._touch(digest):
+                return None
+            if pin is not None:
+                pin.add(digest)
+        return digest
+
+    def _touch(self, digest):
+        """Mark audio as recently used; False if it isn't cached."""
+        try:
+            os.utime(self.audio_path(digest))
+            return True
+        except OSError:
+            return False
+
+    def read(self, digest):
+        try:
+            with open(self.audio_path(digest), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, provider, voice, text, audio, pin=None):
+        """Store audio for a request; returns its content digest."""
+        digest = hashlib.sha256(audio).hexdigest()
+        os.makedirs(os.path.join(self.directory, "refs"), exist_ok=True)
+        if pin is not None:
+            with self._lock:
+                pin.add(digest)
+        path = self.audio_path(digest)
+        with self._lock:
+            exists = self._touch(digest)
+        if not exists:
+            _write_atomic(path, audio)
+        _write_atomic(self._ref_path(request_key(provider, voice, text)), digest.encode("ascii"))
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % _PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+        return digest
+
+    def put_manifest(self, manifest):
+        """Store a batch manifest (bytes); returns its id (a hash of the content)."""
+        manifest_id = hashlib.sha256(manifest).hexdigest()[:32]
+        os.makedirs(os.path.join(self.directory, "manifests"), exist_ok=True)
+        with self._lock:
+            try:
+                os.utime(self._manifest_path(manifest_id))
+                return manifest_id
+            except OSError:
+                pass
+        _write_atomic(self._manifest_path(manifest_id), manifest)
+        return manifest_id
+
+    def read_manifest(self, manifest_id):
+        try:
+            with open(self._manifest_path(manifest_id), "rb") as f:
+                manifest = f.read()
+        except OSError:
+            return None
+        with self._lock:
+            try:
+                os.utime(self._manifest_path(manifest_id))
+            except OSError:
+                pass
+        return manifest
+
+    def prune(self):
+        """Delete least recently used audio and manifests until the cache fits max_bytes."""
+        entries = []
+        for directory, suffix in ((self.directory, ".mp3"), (os.path.join(self.directory, "manifests"), ".json")):
+            try:
+                entries.extend(entry for entry in os.scandir(directory) if entry.name.endswith(suffix))
+            except OSError:
+                pass
+        stats = sorted(((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries))
+        total = sum(size for _, size, _ in stats)
+        for mtime, size, path in stats:
+            if total <= self.max_bytes:
+                break
+            digest = os.path.splitext(os.path.basename(path))[0]
+            with self._lock:
+                if any(digest in pins for pins in self._pins.values()):
+                    continue
+                try:
+                    if os.stat(path).st_mtime != mtime:
+                        continue    # hit since the scan: recently used after all
+                    os.unlink(path)
+                    total -= size
+                except OSError:
+                    pass
+
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+tts_cache = TTSCache()
@@ -0,0 +1,329 @@
+# tts_text.py
+# -*- coding: utf-8 -*-
+"""
+Turn LLM replies into clean, provider-sized text for speech synthesis.
+
+LLM output is markdown: headings, lists, code, links, emoji. Spoken as-is
+it sounds wrong, and one long string is slow to synthesize and more likely
+to fail. `SpeechChunker` strips markup, expands abbreviations, symbols and
+numbers (English only) and cuts the text into synthesis units no longer
+than the provider answers fastest for:
+
+    chunker = SpeechChunker("edge")
+    for delta in llm_stream:
+        for unit in chunker.feed(delta):
+            synthesize(unit)
+    for unit in chunker.flush():
+        synthesize(unit)
+
+Units are emitted as soon as a sentence (or list item / line) is complete.
+The first unit is kept short for fast first audio; units that become ready
+together are merged up to the provider's size.
+"""
+import re
+
+# Characters per request the providers answer fastest for; gTTS splits
+# anything longer into several requests itself
+PROVIDER_MAX_CHARS = {"gtts": 100, "edge": 200}
+DEFAULT_MAX_CHARS = 150
+
+# --- markdown / markup ---
+_CODE_FENCE = re.compile(r"^\s*(```|~~~)")
+_HEADING = re.compile(r"^\s{0,3}#{1,6}\s+")
+_BLOCKQUOTE = re.compile(r"^\s*>+\s?")
+_BULLET = re.compile(r"^\s*(?:[-*+•]|\d{1,3}[.)])\s+")
+_RULE = re.compile(r"^\s*(?:[-*_]\s*){3,}$")
+_TABLE_SEPARATOR = re.compile(r"^\s*\|?[\s:|-]+\|[\s:|-]*$")
+_IMAGE = re.compile(r"!\[([^\]]*)\]\([^)]*\)")
+_LINK = re.compile(r"\[([^\]]+)\]\([^)]*\)")
+_INLINE_CODE = re.compile(r"`+([^`]*)`+")
+_STRONG = re.compile(r"(\*\*|__)(.+?)\1")
+_EMPHASIS = re.compile(r"(?<![\w*])([*_])(?=\S)(.+?)(?<=\S)\1(?![\w*])")
+_STRIKE = re.compile(r"~~(.+?)~~")
+_HTML_TAG = re.compile(r"</?[A-Za-z][^>]*>")
+_URL = re.compile(r"https?://\S+|www\.\S+")
+# "2*3" is arithmetic, not emphasis; kept as × so the markup pass leaves it
+_TIMES = re.compile(r"(?<=\d)\s*[*×]\s*(?=\d)")
+_LEFTOVER_MARKUP = re.compile(r"[*#`|~^]+")
+_EMOJI = re.compile(
+    "["
+    "\U0001F000-\U0001FAFF"   # pictographs, emoticons, transport, symbols
+    "\U00002600-\U000027BF"   # misc symbols, dingbats
+    "\U00002B00-\U00002BFF"   # arrows, stars
+    "\U0001F1E6-\U0001F1FF"   # flags
+    "\U0000FE00-\U0000FE0F"   # variation selectors
+    "\U0000200D"              # zero width joiner
+    "\U000020E3"              # keycap
+    "]+"
+)
+_SPACES = re.compile(r"\s+")
+_SPACE_BEFORE_PUNCTUATION = re.compile(r"\s+([,.;:!?])")
+
+# --- English expansion ---
+ABBREVIATIONS = {
+    "e.g.": "for example",
+    "i.e.": "that is",
+    "etc.": "et cetera",
+    "vs.": "versus",
+    "approx.": "approximately",
+    "Dr.": "Doctor",
+    "Mr.": "Mister",
+    "Mrs.": "Missus",
+    "Ms.": "Miz",
+    "Prof.": "Professor",
+    "St.": "Saint",
+}
+_ABBREVIATION = re.compile(
+    r"(?<!\w)(" + "|".join(re.escape(abbr) for abbr in ABBREVIATIONS) + r")(?!\w)",
+    re.IGNORECASE,
+)
+_ABBREVIATION_LOOKUP = {abbr.lower(): spoken for abbr, spoken in ABBREVIATIONS.items()}
+_CURRENCY = re.compile(
+    r"([$£€¥])\s?(\d{1,3}(?:,\d{3})+|\d+)(?:\.(\d+))?(?![\d,]\d)(?:\s(thousand|million|billion)\b)?"
+)
+# symbol -> (one, many, one minor unit, many minor units)
+_CURRENCY_NAMES = {
+    "$": ("dollar", "dollars", "cent", "cents"),
+    "£": ("pound", "pounds", "penny", "pence"),
+    "€": ("euro", "euros", "cent", "cents"),
+    "¥": ("yen", "yen", None, None),
+}
+_PERCENT = re.compile(r"(\d)\s?%")
+_SYMBOLS = {"&": " and ", "@": " at ", "=": " equals ", "×": " times ",
+            "°C": " degrees Celsius", "°F": " degrees Fahrenheit"}
+_SYMBOL = re.compile("|".join(re.escape(symbol) for symbol in sorted(_SYMBOLS, key=len, reverse=True)))
+# Plain numbers only: times (10:30), dates (1/2), phone numbers (555-1234),
+# versions and words like "mp3" are left to the voice
+_NUMBER = re.compile(r"(?<![\w:/.,-])(\d{1,3}(?:,\d{3})+|\d+)(?:\.(\d+))?(?![\w:/]|\.\d|,\d|-\d)")
+_ORDINAL = re.compile(r"(?<!\w)(\d+)(st|nd|rd|th)\b", re.IGNORECASE)
+
+# --- boundaries ---
+_SENTENCE_END = re.compile(r"[.!?]+[\"')\]*_]*\s+")
+_CLAUSE_BREAK = re.compile(r"[,;:]\s+|\s+[-–—]\s+")
+
+_ONES = ("zero one two three four five six seven eight nine ten eleven twelve thirteen "
+         "fourteen fifteen sixteen seventeen eighteen nineteen").split()
+_TENS = "_ _ twenty thirty forty fifty sixty seventy eighty ninety".split()
+_SCALES = ((10 ** 9, "billion"), (10 ** 6, "million"), (1000, "thousand"))
+_ORDINAL_WORDS = {"one": "first", "two": "second", "three": "third", "five": "fifth",
+                  "eight": "eighth", "nine": "ninth", "twelve": "twelfth"}
+
+
+def number_to_words(n):
+    """English words for a non-negative integer below one trillion."""
+    if n < 20:
+        return _ONES[n]
+    if n < 100:
+        tens, ones = divmod(n, 10)
+        return _TENS[tens] + (f"-{_ONES[ones]}" if ones else "")
+    if n < 1000:
+        hundreds, rest = divmod(n, 100)
+        return f"{_ONES[hundreds]} hundred" + (f" {number_to_words(rest)}" if rest else "")
+    for scale, name in _SCALES:
+        if n >= scale:
+            high, rest = divmod(n, scale)
+            return f"{number_to_words(high)} {name}" + (f" {number_to_words(rest)}" if rest else "")
+    raise ValueError(n)
+
+
+def _year_to_words(n):
+    # 1999 -> nineteen ninety-nine, 1900 -> nineteen hundred, 2005 -> two thousand five
+    high, low = divmod(n, 100)
+    if n % 1000 < 10:
+        return number_to_words(n)
+    return f"{number_to_words(high)} {number_to_words(low) if low else 'hundred'}"
+
+
+def _spell_number(match):
+    integer, fraction = match.group(1), match.group(2)
+    digits = integer.replace(",", "")
+    if len(digits) > 12 or (len(digits) > 1 and digits.startswith("0")):
+        return " ".join(_ONES[int(d)] for d in digits)  # IDs, phone numbers, codes
+    value = int(digits)
+    if fraction is None and "," not in integer and 1100 <= value <= 2099:
+        words = _year_to_words(value)
+    else:
+        words = number_to_words(value)
+    if fraction is not None:
+        words += " point " + " ".join(_ONES[int(d)] for d in fraction)
+    return words
+
+
+def _spell_ordinal(match):
+    words = number_to_words(int(match.group(1))) if len(match.group(1)) <= 12 else match.group(1)
+    head, _, last = words.rpartition(" ")
+    last_head, hyphen, last_word = last.rpartition("-")
+    if last_word in _ORDINAL_WORDS:
+        last_word = _ORDINAL_WORDS[last_word]
+    elif last_word.endswith("y"):
+        last_word = last_word[:-1] + "ieth"
+    else:
+        last_word += "th"
+    return (f"{head} " if head else "") + last_head + hyphen + last_word
+
+
+def _spell_currency(match):
+    # $3.50 -> three dollars and fifty cents, $2 million -> 2 million dollars
+    symbol, integer, fraction, scale = match.groups()
+    one, many, minor_one, minor_many = _CURRENCY_NAMES[symbol]
+    amount = integer + (f".{fraction}" if fraction is not None else "")
+    if scale:
+        return f"{amount} {scale} {many}"
+    digits = integer.replace(",", "")
+    if len(digits) > 12 or (fraction is not None and (len(fraction) != 2 or minor_one is None)):
+        return f"{amount} {many}"   # spelled by _NUMBER ("three point five dollars")
+    value, minor = int(digits), int(fraction or 0)
+    words = []
+    if value or not minor:
+        words.append(f"{number_to_words(value)} {one if value == 1 else many}")
+    if minor:
+        words.append(f"{number_to_words(minor)} {minor_one if minor == 1 else minor_many}")
+    return " and ".join(words)
+
+
+def _spell_table_row(line):
+    if _TABLE_SEPARATOR.match(line):
+        return ""
+    cells = [cell.strip() for cell in line.strip().strip("|").split("|")]
+    return ", ".join(cell for cell in cells if cell)
+
+
+def normalize_line(line, language="en"):
+    """Speakable text for one line of (markdown) LLM output; "" if nothing to say."""
+    if _RULE.match(line):
+        return ""
+    if line.lstrip().startswith("|"):
+        line = _spell_table_row(line)
+    line = _HEADING.sub("", line)
+    line = _BLOCKQUOTE.sub("", line)
+    line = _BULLET.sub("", line)
+    line = _IMAGE.sub(r"\1", line)
+    line = _LINK.sub(r"\1", line)
+    line = _INLINE_CODE.sub(r"\1", line)
+    line = _STRONG.sub(r"\2", line)
+    line = _EMPHASIS.sub(r"\2", line)
+    line = _STRIKE.sub(r"\1", line)
+    line = _TIMES.sub(" × ", line)
+    line = _HTML_TAG.sub(" ", line)
+    line = _URL.sub(" ", line)
+    line = _EMOJI.sub(" ", line)
+    line = _LEFTOVER_MARKUP.sub(" ", line)
+    if language.lower().startswith("en"):
+        line = _ABBREVIATION.sub(lambda m: _ABBREVIATION_LOOKUP[m.group(1).lower()], line)
+        line = _CURRENCY.sub(_spell_currency, line)
+        line = _PERCENT.sub(r"\1 percent", line)
+        line = _SYMBOL.sub(lambda m: _SYMBOLS[m.group(0)], line)
+        line = _ORDINAL.sub(_spell_ordinal, line)
+        line = _NUMBER.sub(_spell_number, line)
+    line = _SPACES.sub(" ", line)
+    line = _SPACE_BEFORE_PUNCTUATION.sub(r"\1", line)
+    line = line.strip()
+    # Nothing but punctuation left (e.g. an emoji-only line)
+    return line if any(c.isalnum() for c in line) else ""
+
+
+def split_to_size(text, max_chars):
+    """Cut text longer than max_chars at clause breaks, else at spaces."""
+    units = []
+    while len(text) > max_chars:
+        window = text[:max_chars + 1]
+        cut = max((m.end() for m in _CLAUSE_BREAK.finditer(window)), default=0)
+        if cut < max_chars // 3:
+            cut = window.rfind(" ") + 1 or max_chars
+        units.append(text[:cut].strip())
+        text = text[cut:].strip()
+    if text:
+        units.append(text)
+    return units
+
+
+def _is_false_sentence_end(text):
+    """A '.' + space that ends an abbreviation, an initial or a list number."""
+    last_word = text.rsplit(None, 1)[-1] if text.strip() else ""
+    if last_word.lower() in _ABBREVIATION_LOOKUP:
+        return True
+    if len(last_word) == 2 and last_word[0].isalpha() and last_word[1] == ".":
+        return True  # "J. Smith"
+    return bool(re.fullmatch(r"\s*(?:[-*+]\s+)?\d{1,3}[.)]", text))
+
+
+class SpeechChunker:
+    """Incremental markdown-to-synthesis-units converter for one reply."""
+
+    def __init__(self, provider="gtts", language="en", max_chars=None):
+        self.max_chars = max_chars or PROVIDER_MAX_CHARS.get(provider, DEFAULT_MAX_CHARS)
+        self.language = language
+        self._buffer = ""           # raw text not yet turned into units
+        self._in_code = False       # inside a ``` fence
+        self._emitted = 0
+
+    def feed(self, text):
+        """Add streamed text; returns the synthesis units now complete."""
+        self._buffer += text
+        segments = []
+        while "\n" in self._buffer:
+            line, self._buffer = self._buffer.split("\n", 1)
+            segments.extend(self._complete_line(line))
+        segments.extend(self._complete_sentences())
+        return self._pack(segments)
+
+    def flush(self):
+        """End of the reply: everything left, as units."""
+        line, self._buffer = self._buffer, ""
+        segments = self._complete_line(line)
+        self._in_code = False
+        return self._pack(segments)
+
+    def _complete_line(self, line):
+        if _CODE_FENCE.match(line):
+            self._in_code = not self._in_code
+            return []
+        if self._in_code:
+            return []   # code is shown in the transcript, not read aloud
+        return self._split_sentences(line, final=True)
+
+    def _complete_sentences(self):
+        """Take finished sentences off the start of the unfinished current line."""
+        line = self._buffer
+        if self._in_code or line.lstrip().startswith(("```", "~~~", "|")):
+            return []   # needs the whole line
+        return self._split_sentences(line, final=False)
+
+    def _split_sentences(self, line, final):
+        segments, start = [], 0
+        for match in _SENTENCE_END.finditer(line):
+            if _is_false_sentence_end(line[start:match.end()].rstrip()):
+                continue
+            segments.append(line[start:match.end()])
+            start = match.end()
+        rest = line[start:]
+        if not final and len(rest) > 2 * self.max_chars:
+            # No sentence end in sight: cut at the last clause break or space
+            cut = max((m.end() for m in _CLAUSE_BREAK.finditer(rest)), default=0) or rest.rfind(" ") + 1
+            if cut:
+                segments.append(rest[:cut])
+                rest = rest[cut:]
+        if final:
+            segments.append(rest)
+        else:
+            self._buffer = rest
+        return [text for text in (normalize_line(segment, self.language) for segment in segments) if text]
+
+    def _pack(self, segments):
+        units = []
+        for segment in segments:
+            for piece in split_to_size(segment, self.max_chars):
+                # The first unit goes out alone so the first audio starts early
+                if units and self._emitted > 1 and len(units[-1]) + 2 + len(piece) <= self.max_chars:
+                    # List items and table rows have no full stop; keep the pause between them
+                    units[-1] += (" " if units[-1][-1] in ".!?;:," else ". ") + piece
+                else:
+                    units.append(piece)
+                    self._emitted += 1
+        return units
+
+
+def prepare_speech(text, provider="gtts", language="en"):
+    """All synthesis units for a complete reply."""
+    chunker = SpeechChunker(provider, language)
+    return chunker.feed(text) + chunker.flush()
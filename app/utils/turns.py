@@ -0,0 +1,29 @@
+# turns.py
+# -*- coding: utf-8 -*-
+import threading
+
+
+class TurnCancelled(Exception):
+    """Raised inside a pipeline stage when its turn has been cancelled."""
+
+
+class Turn:
+    """
+    One user utterance travelling through decode -> ASR -> LLM -> TTS.
+
+    Stages call `check()` between steps and pass `cancel_event` to blocking
+    upstream calls so they can abort early.
+    """
+
+    def __init__(self, sid, turn_id):
+        self.sid = sid
+        self.turn_id = turn_id
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def check(self):
+        if self.cancel_event.is_set():
+            raise TurnCancelled(f"Turn {self.turn_id} cancelled")
+
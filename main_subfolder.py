@@ -1,51 +1,83 @@
-from flask import Flask, render_template, send_from_directory
+if __name__ == "__main__":
+    # Patch before anything imports socket/threading/requests so a handler
+    # waiting on upstream I/O yields to the other sockets instead of
+    # stalling the hub (spawned pool workers import this as __mp_main__)
+    import eventlet
+    eventlet.monkey_patch()
+
+from flask import Flask, render_template
 from flask_socketio import SocketIO
 from flask_cors import CORS  
 import os
-from app.routers.streaming_avatar import streaming_avatar, register_socketio_handlers
-from app.routers.chatbot import chatbot
-
-# Create Flask app
-app = Flask(__name__)
 
 # Get base path from environment (for subfolder deployment)
 BASE_PATH = os.environ.get('BASE_PATH', '')  # e.g., '/audiotutor'
 
-# --- Enable CORS for REST API ---
-CORS(app, resources={r"/api/*": {"origins": "*"}})  
 
-# Register blueprints with base path
-app.register_blueprint(streaming_avatar, url_prefix=f"{BASE_PATH}/api/streaming-avatar")
-app.register_blueprint(chatbot, url_prefix=f"{BASE_PATH}/api/chatbot")
+def create_app():
+    """
+    Build the Flask app and its SocketIO server, register the socket
+    handlers and start the dependency probes.
+
+    Nothing of this runs at import time: spawned batch-transcription
+    workers re-import this file as __mp_main__ and must stay bare.
+    """
+    from app.routers.streaming_avatar import streaming_avatar, register_socketio_handlers
+    from app.routers.chatbot import chatbot
+    from app.routers.health import health
+    from app.utils.health import health_monitor
+    from app.utils.assets import StaticAssets
+
+    # Create Flask app
+    app = Flask(__name__, static_folder=None)  # static/ is served by static_assets below
+    # Larger request bodies are refused with 413 before they are read
+    app.config['MAX_CONTENT_LENGTH'] = int(float(os.environ.get('MAX_UPLOAD_MB', '200')) * 1024 * 1024)
+
+    # --- Enable CORS for REST API ---
+    CORS(app, resources={r"/api/*": {"origins": "*"}})  
+
+    # Register blueprints with base path
+    app.register_blueprint(streaming_avatar, url_prefix=f"{BASE_PATH}/api/streaming-avatar")
+    app.register_blueprint(chatbot, url_prefix=f"{BASE_PATH}/api/chatbot")
+    app.register_blueprint(health, url_prefix=BASE_PATH)
+
+    # Static files are loaded and precompressed once; served with ETags/ranges
+    static_assets = StaticAssets(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')).build()
+
+    # Add routes with base path support
+    @app.route(f"{BASE_PATH}/")
+    @app.route(f"{BASE_PATH}/index")
+    def index():
+        return static_assets.serve('index.html')
+
+    @app.route(f"{BASE_PATH}/avatar")
+    def avatar():
+        return static_assets.serve('avatar.html')
 
-# Add routes with base path support
-@app.route(f"{BASE_PATH}/")
-@app.route(f"{BASE_PATH}/index")
-def index():
-    return send_from_directory('static', 'index.html')
+    @app.route(f"{BASE_PATH}/static/<path:filename>")
+    def static_files(filename):
+        return static_assets.serve(filename)
 
-@app.route(f"{BASE_PATH}/avatar")
-def avatar():
-    return send_from_directory('static', 'avatar.html')
+    # Handle root route when no base path
+    if not BASE_PATH:
+        @app.route("/")
+        def root_index():
+            return static_assets.serve('index.html')
 
-@app.route(f"{BASE_PATH}/static/<path:filename>")
-def static_files(filename):
-    return send_from_directory('static', filename)
+    # Initialize SocketIO with base path support
+    socket_path = f"{BASE_PATH}/socket.io/" if BASE_PATH else "/socket.io/"
+    socketio = SocketIO(app, cors_allowed_origins="*", async_mode="eventlet", path=socket_path)
 
-# Handle root route when no base path
-if not BASE_PATH:
-    @app.route("/")
-    def root_index():
-        return send_from_directory('static', 'index.html')
+    # Register websocket event handlers
+    register_socketio_handlers(socketio)
 
-# Initialize SocketIO with base path support
-socket_path = f"{BASE_PATH}/socket.io/" if BASE_PATH else "/socket.io/"
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode="eventlet", path=socket_path)
+    # Dependency probes for /healthz and /readyz
+    health_monitor.start()
+    return app, socketio
 
-# Register websocket event handlers
-register_socketio_handlers(socketio)
 
 if __name__ == "__main__":
+    app, socketio = create_app()
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_ENV') == 'development'
     # Run
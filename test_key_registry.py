@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Unit tests for app/utils/key_registry.py (no server or network needed):
+
+    python -m unittest test_key_registry
+"""
+import unittest
+from unittest import mock
+
+from app.utils.key_registry import DEFAULT_TENANT, KeyRegistry, QuotaExceeded, Tenant
+
+TENANTS = {
+    "school-a": {"api_key": "upstream-a", "client_token": "token-a", "daily_requests": 2},
+    "school-b": {"api_key": "upstream-b", "client_token": "token-b", "daily_tokens": 100},
+}
+
+
+class QuotaTest(unittest.TestCase):
+    def test_request_quota(self):
+        tenant = Tenant("school", "key", daily_requests=2)
+        tenant.reserve()
+        tenant.reserve()
+        with self.assertRaises(QuotaExceeded):
+            tenant.reserve()
+        self.assertEqual(tenant.flush(), (2, 0, 1))
+        self.assertEqual((tenant.requests_today, tenant.rejected_today), (2, 1))
+
+    def test_token_quota_applies_after_flush(self):
+        tenant = Tenant("school", "key", daily_tokens=100)
+        tenant.reserve()
+        tenant.record_tokens(120)
+        # Usage is folded in by the flusher; until then the request goes through
+        tenant.reserve()
+        tenant.flush()
+        self.assertEqual(tenant.tokens_today, 120)
+        with self.assertRaises(QuotaExceeded):
+            tenant.reserve()
+
+    def test_flush_only_reports_new_usage(self):
+        tenant = Tenant("school", "key")
+        tenant.reserve()
+        tenant.record_tokens(7)
+        self.assertEqual(tenant.flush(), (1, 7, 0))
+        self.assertEqual(tenant.flush(), (0, 0, 0))
+        self.assertEqual(tenant.usage()["tokens"], 7)
+
+    def test_day_rollover_resets_quotas(self):
+        with mock.patch("app.utils.key_registry._today", return_value="2026-01-01"):
+            tenant = Tenant("school", "key", daily_requests=1, daily_tokens=10)
+            tenant.reserve()
+            tenant.record_tokens(50)
+            tenant.flush()
+            with self.assertRaises(QuotaExceeded):
+                tenant.reserve()
+        with mock.patch("app.utils.key_registry._today", return_value="2026-01-02"):
+            tenant.flush()
+            self.assertEqual(tenant.usage()["day"], "2026-01-02")
+            self.assertEqual((tenant.requests_today, tenant.tokens_today, tenant.rejected_today), (0, 0, 0))
+            tenant.reserve()
+            with self.assertRaises(QuotaExceeded):
+                tenant.reserve()
+
+    def test_usage_before_midnight_is_not_counted_on_the_new_day(self):
+        with mock.patch("app.utils.key_registry._today", return_value="2026-01-01"):
+            tenant = Tenant("school", "key")
+            tenant.reserve()
+        with mock.patch("app.utils.key_registry._today", return_value="2026-01-02"):
+            self.assertEqual(tenant.flush(), (1, 0, 0))
+            self.assertEqual(tenant.requests_today, 0)
+
+
+class RegistryTest(unittest.TestCase):
+    def test_tenants_are_selected_by_token_not_name(self):
+        registry = KeyRegistry(TENANTS, default_api_key="server-key")
+        self.assertEqual(registry.get("token-a").name, "school-a")
+        self.assertEqual(registry.get("token-b").api_key, "upstream-b")
+        self.assertIsNone(registry.get("school-a"))
+        self.assertIsNone(registry.get("wrong-token"))
+
+    def test_unnamed_calls_are_refused_once_tenants_are_configured(self):
+        registry = KeyRegistry(TENANTS, default_api_key="server-key")
+        self.assertIsNone(registry.get())
+
+    def test_default_tenant_has_a_quota(self):
+        registry = KeyRegistry(None, default_api_key="server-key")
+        tenant = registry.get()
+        self.assertEqual(tenant.name, DEFAULT_TENANT)
+        self.assertIsNotNone(tenant.daily_requests)
+        self.assertIsNone(registry.get(allow_default=False))
+
+    def test_no_default_tenant_without_a_server_key(self):
+        registry = KeyRegistry(None, default_api_key=None)
+        self.assertIsNone(registry.default)
+        self.assertIsNone(registry.get())
+
+    def test_invalid_config(self):
+        with self.assertRaises(KeyError):
+            KeyRegistry({"school": {"api_key": "key"}})
+        with self.assertRaises(ValueError):
+            KeyRegistry({"a": {"api_key": "1", "client_token": "same"}, "b": {"api_key": "2", "client_token": "same"}})
+        with self.assertRaises(ValueError):
+            KeyRegistry({DEFAULT_TENANT: {"api_key": "1", "client_token": "t"}})
+
+    def test_usage_covers_every_tenant(self):
+        registry = KeyRegistry(TENANTS, default_api_key="server-key")
+        registry.get("token-a").reserve()
+        registry.flush()
+        usage = {entry["tenant"]: entry for entry in registry.usage()}
+        self.assertEqual(set(usage), {DEFAULT_TENANT, "school-a", "school-b"})
+        self.assertEqual(usage["school-a"]["requests"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
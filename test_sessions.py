@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Unit tests for app/utils/sessions.py (no server or network needed):
+
+    python -m unittest test_sessions
+"""
+import time
+import unittest
+
+from app.utils.sessions import SessionRegistry
+
+CHUNK = b"\0" * 4096
+
+
+def make_registry(budget_bytes=64 * 1024, max_partial_bytes=32 * 1024, idle_seconds=30):
+    return SessionRegistry(budget_bytes=budget_bytes, max_partial_bytes=max_partial_bytes,
+                           idle_seconds=idle_seconds)
+
+
+def go_idle(session, seconds=60):
+    session.last_active = time.monotonic() - seconds
+
+
+class PartialAudioTest(unittest.TestCase):
+    def test_chunks_are_buffered_and_accounted(self):
+        registry = make_registry()
+        session = registry.open("a", None)
+        self.assertTrue(registry.append_partial(session, CHUNK))
+        self.assertTrue(registry.append_partial(session, CHUNK))
+        self.assertEqual(session.partial.tobytes(), CHUNK * 2)
+        self.assertEqual(registry.stats()["buffered_bytes"], session.partial.nbytes)
+
+        registry.reset_partial(session)
+        self.assertIsNone(session.partial)
+        self.assertEqual(registry.stats()["buffered_bytes"], 0)
+
+    def test_session_cap_downgrades_the_sender(self):
+        registry = make_registry(max_partial_bytes=len(CHUNK) * 2)
+        session = registry.open("a", None)
+        self.assertTrue(registry.append_partial(session, CHUNK))
+        self.assertTrue(registry.append_partial(session, CHUNK))
+        self.assertFalse(registry.append_partial(session, CHUNK))
+        self.assertTrue(session.degraded)
+        self.assertIsNone(session.partial)
+        # Stays downgraded for the rest of the utterance...
+        self.assertFalse(registry.append_partial(session, CHUNK))
+        self.assertEqual(registry.downgrades, 1)
+        # ...and speculates again on the next one
+        registry.reset_partial(session)
+        self.assertTrue(registry.append_partial(session, CHUNK))
+
+    def test_closing_releases_the_buffer(self):
+        registry = make_registry()
+        session = registry.open("a", None)
+        registry.append_partial(session, CHUNK)
+        registry.close("a")
+        self.assertEqual(len(registry), 0)
+        self.assertEqual(registry.stats()["buffered_bytes"], 0)
+
+
+class MemoryBudgetTest(unittest.TestCase):
+    def test_idle_buffers_are_dropped_before_refusing(self):
+        registry = make_registry(budget_bytes=len(CHUNK) * 3 + 1024)
+        stalled = registry.open("stalled", None)
+        registry.append_partial(stalled, CHUNK)
+        registry.append_partial(stalled, CHUNK)
+        go_idle(stalled)
+
+        speaker = registry.open("speaker", None)
+        self.assertTrue(registry.append_partial(speaker, CHUNK))
+        self.assertTrue(registry.append_partial(speaker, CHUNK))
+        self.assertTrue(stalled.degraded)
+        self.assertIsNone(stalled.partial)
+        self.assertFalse(speaker.degraded)
+
+    def test_active_buffers_are_kept_and_the_sender_is_refused(self):
+        registry = make_registry(budget_bytes=len(CHUNK) * 3 + 1024)
+        first = registry.open("first", None)
+        registry.append_partial(first, CHUNK)
+        registry.append_partial(first, CHUNK)
+
+        second = registry.open("second", None)
+        self.assertTrue(registry.append_partial(second, CHUNK))
+        self.assertFalse(registry.append_partial(second, CHUNK))
+        self.assertTrue(second.degraded)
+        self.assertFalse(first.degraded)
+        self.assertEqual(first.partial.tobytes(), CHUNK * 2)
+
+    def test_no_session_is_ever_closed_to_make_room(self):
+        registry = make_registry(budget_bytes=10 * 1024)
+        listeners = [registry.open(f"listener-{i}", None) for i in range(1000)]
+        for session in listeners:
+            go_idle(session)
+        speaker = registry.open("speaker", None)
+        for _ in range(5):
+            registry.append_partial(speaker, CHUNK)
+        self.assertEqual(len(registry), 1001)
+        self.assertTrue(all(registry.get(session.sid) is session for session in listeners))
+        self.assertTrue(speaker.degraded)
+        self.assertLessEqual(registry.stats()["buffered_bytes"], registry.budget_bytes)
+
+    def test_session_objects_do_not_count_against_the_budget(self):
+        registry = make_registry(budget_bytes=len(CHUNK) * 2)
+        for i in range(1000):
+            registry.open(f"listener-{i}", None)
+        speaker = registry.open("speaker", None)
+        self.assertTrue(registry.append_partial(speaker, CHUNK))
+        stats = registry.stats()
+        self.assertGreater(stats["memory_bytes"], stats["budget_bytes"])
+        self.assertEqual(stats["memory_bytes"], 1001 * stats["session_object_bytes"] + stats["buffered_bytes"])
+
+
+class TurnTest(unittest.TestCase):
+    def test_new_turn_cancels_the_previous_one(self):
+        registry = make_registry()
+        session = registry.open("a", None)
+        first = registry.start_turn(session)
+        second = registry.start_turn(session)
+        self.assertTrue(first.cancel_event.is_set())
+        self.assertFalse(second.cancel_event.is_set())
+        self.assertIsNone(registry.cancel_turn(session, first.turn_id))
+        self.assertEqual(registry.cancel_turn(session, second.turn_id), second.turn_id)
+        self.assertTrue(second.cancel_event.is_set())
+
+
+if __name__ == "__main__":
+    unittest.main()
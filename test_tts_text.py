@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Unit tests for app/utils/tts_text.py (no server or network needed):
+
+    python -m unittest test_tts_text
+"""
+import re
+import unittest
+
+from app.utils.tts_text import SpeechChunker, normalize_line, prepare_speech, number_to_words
+
+LESSON_REPLY = """## Photosynthesis
+
+Plants make food from light. It happens in the **chloroplasts**, e.g. in leaves. Dr. Smith says it's cool 🌱.
+
+1. Light is absorbed.
+2. Water is split.
+3. Sugar is made.
+
+```python
+print("not spoken")
+```
+
+| Part | Job |
+|------|-----|
+| Leaf | Food |
+
+That's it! See [the notes](https://example.com/notes) for more."""
+
+
+def words(units):
+    return re.findall(r"[\w']+", " ".join(units).lower())
+
+
+class NormalizeLineTest(unittest.TestCase):
+    def test_markdown_is_stripped(self):
+        self.assertEqual(normalize_line("## **Bold** and *italic* with `code`"), "Bold and italic with code")
+        self.assertEqual(normalize_line("- see [the docs](https://example.com)"), "see the docs")
+        self.assertEqual(normalize_line("> quoted ~~old~~ text"), "quoted old text")
+
+    def test_nothing_to_say(self):
+        self.assertEqual(normalize_line("🎉🎉"), "")
+        self.assertEqual(normalize_line("---"), "")
+        self.assertEqual(normalize_line("|---|---|"), "")
+
+    def test_abbreviations(self):
+        self.assertEqual(normalize_line("Fruit, e.g. apples, vs. sweets"), "Fruit, for example apples, versus sweets")
+
+    def test_numbers(self):
+        self.assertEqual(normalize_line("I have 3 cats"), "I have three cats")
+        self.assertEqual(normalize_line("It weighs 2.5 kg"), "It weighs two point five kg")
+        self.assertEqual(normalize_line("About 1,250 people"), "About one thousand two hundred fifty people")
+        self.assertEqual(normalize_line("Born in 1999"), "Born in nineteen ninety-nine")
+        self.assertEqual(normalize_line("The 21st century"), "The twenty-first century")
+        self.assertEqual(normalize_line("50% done"), "fifty percent done")
+
+    def test_times_dates_and_codes_are_left_alone(self):
+        self.assertEqual(normalize_line("Meet at 10:30 on 1/2"), "Meet at 10:30 on 1/2")
+        self.assertEqual(normalize_line("Play the mp3"), "Play the mp3")
+
+    def test_multiplication(self):
+        self.assertEqual(normalize_line("2*3=6"), "two times three equals six")
+        self.assertEqual(normalize_line("so 4 * 5 = 20"), "so four times five equals twenty")
+
+    def test_hyphenated_digit_runs(self):
+        self.assertEqual(normalize_line("Call 555-1234 today"), "Call 555-1234 today")
+        self.assertEqual(normalize_line("From 1990-2000"), "From 1990-2000")
+
+    def test_currency(self):
+        self.assertEqual(normalize_line("It costs $3.50."), "It costs three dollars and fifty cents.")
+        self.assertEqual(normalize_line("$1"), "one dollar")
+        self.assertEqual(normalize_line("$0.99"), "ninety-nine cents")
+        self.assertEqual(normalize_line("£2.01"), "two pounds and one penny")
+        self.assertEqual(normalize_line("€10.00"), "ten euros")
+        self.assertEqual(normalize_line("$2.5 million"), "two point five million dollars")
+        self.assertEqual(normalize_line("$5, then more"), "five dollars, then more")
+
+    def test_other_languages_are_not_expanded(self):
+        self.assertEqual(normalize_line("**3** 個蘋果", language="zh-HK"), "3 個蘋果")
+
+
+class NumberToWordsTest(unittest.TestCase):
+    def test_values(self):
+        self.assertEqual(number_to_words(0), "zero")
+        self.assertEqual(number_to_words(42), "forty-two")
+        self.assertEqual(number_to_words(1000001), "one million one")
+
+
+class SpeechChunkerTest(unittest.TestCase):
+    def test_units_fit_the_provider(self):
+        for provider, limit in (("gtts", 100), ("edge", 200)):
+            units = prepare_speech(LESSON_REPLY + " " + "word " * 120, provider)
+            self.assertTrue(units)
+            self.assertTrue(all(0 < len(unit) <= limit for unit in units), units)
+
+    def test_code_is_not_spoken(self):
+        units = prepare_speech(LESSON_REPLY)
+        self.assertNotIn("print", words(units))
+        self.assertNotIn("python", words(units))
+
+    def test_lesson_reply(self):
+        units = prepare_speech(LESSON_REPLY)
+        self.assertEqual(units[0], "Photosynthesis")
+        text = " ".join(units)
+        self.assertIn("for example in leaves.", text)
+        self.assertIn("Doctor Smith", text)
+        self.assertIn("Leaf, Food", text)
+        self.assertNotIn("example.com", text)
+        self.assertNotIn("*", text)
+
+    def test_streaming_matches_whole_reply(self):
+        chunker = SpeechChunker("gtts")
+        streamed = []
+        for char in LESSON_REPLY:
+            streamed.extend(chunker.feed(char))
+        streamed.extend(chunker.flush())
+        self.assertEqual(words(streamed), words(prepare_speech(LESSON_REPLY)))
+
+    def test_sentences_are_emitted_as_soon_as_complete(self):
+        chunker = SpeechChunker("edge")
+        self.assertEqual(chunker.feed("Hello there. How"), ["Hello there."])
+        self.assertEqual(chunker.feed(" are you"), [])
+        self.assertEqual(chunker.flush(), ["How are you"])
+
+    def test_abbreviations_and_list_numbers_do_not_end_sentences(self):
+        chunker = SpeechChunker("edge")
+        self.assertEqual(chunker.feed("Ask Dr. Lee, e.g. about"), [])
+        self.assertEqual(chunker.feed("\n"), ["Ask Doctor Lee, for example about"])
+        self.assertEqual(chunker.feed("2. "), [])
+
+    def test_first_unit_alone_then_merged_with_pauses(self):
+        units = prepare_speech("- one\n- two\n- three\n- four\n")
+        self.assertEqual(units, ["one", "two. three. four"])
+
+    def test_long_text_without_punctuation_is_cut(self):
+        chunker = SpeechChunker("gtts")
+        units = chunker.feed("word " * 60)
+        self.assertTrue(units)
+        self.assertTrue(all(len(unit) <= 100 for unit in units))
+
+    def test_unterminated_code_fence_does_not_leak_into_next_reply(self):
+        chunker = SpeechChunker("edge")
+        chunker.feed("```\nsecret()\n")
+        self.assertEqual(chunker.flush(), [])
+        self.assertEqual(chunker.feed("Spoken again.\n"), ["Spoken again."])
+
+
+if __name__ == "__main__":
+    unittest.main()